@@ -0,0 +1,5 @@
+"""
+timing scripts for the ingestion pipeline and dashboards;
+run from the repository root, e.g.
+python -m benchmarks.fetch_phases
+"""
@@ -0,0 +1,79 @@
+"""
+count the callback requests a dropdown change sends to each
+dashboard and time answering them, through the Flask test
+client; requests are sent one after another, so the total
+is an upper bound on what the browser waits for
+
+usage: python -m benchmarks.callbacks [n_selections]
+"""
+
+import sys
+import time
+
+from figure_cache import outputs_spec
+
+
+def select(app, client, values, changed, no_update=None):
+    """send every server callback that `changed` (a dropdown id)
+    triggers, as the renderer would; return the request count
+
+    a callback that fails raises, rather than being timed as
+    if it had answered; ones that prevent the update (status
+    204) are counted in no_update['n'], if given
+    """
+    n = 0
+    for output, entry in app.callback_map.items():
+        inputs = entry['inputs']
+        if 'callback' not in entry or \
+                {'id': changed, 'property': 'value'} not in inputs:
+            continue
+        response = client.post('/_dash-update-component', json={
+            'output': output,
+            'outputs': outputs_spec(output),
+            'inputs': [dict(i, value=values[i['id']]) for i in inputs],
+            'changedPropIds': ['%s.value' % changed]
+        }, headers={'Accept-Encoding': 'gzip'})
+        if response.status_code == 204:
+            if no_update is not None:
+                no_update['n'] += 1
+        elif response.status_code != 200:
+            raise RuntimeError('callback %s failed with status %d for %r' % (
+                output, response.status_code, values))
+        n += 1
+    return n
+
+
+def run(n_selections=50):
+    import dash_script
+    import head_to_head
+
+    cases = [
+        ('dash_script', dash_script.app, 'player-dropdown',
+         [{'player-dropdown': p, 'season-dropdown': 'All',
+           'map-level': dash_script.DEFAULT_LEVEL,
+           'ranking-dropdown': dash_script.RANKING}
+          for p in list(dash_script.trace_index)[:n_selections]]),
+        ('head_to_head', head_to_head.app, 'p1-dropdown',
+         [{'p1-dropdown': p, 'p2-dropdown': 'Armada', 'season-dropdown': 'All',
+           'ranking-dropdown': head_to_head.RANKING}
+          for p in head_to_head.top100[:n_selections]]),
+    ]
+    for name, app, dropdown, selections in cases:
+        client = app.server.test_client()
+        # first pass pays for cold caches, second shows repeats
+        for label in ('first', 'repeat'):
+            requests = 0
+            no_update = {'n': 0}
+            start = time.perf_counter()
+            for values in selections:
+                requests += select(app, client, values, dropdown, no_update)
+            seconds = time.perf_counter() - start
+            print('%-12s %-6s %d requests per selection, %.2f ms per selection, '
+                  '%d of %d without an update' % (
+                name, label, requests // len(selections),
+                seconds / len(selections) * 1000, no_update['n'], requests
+            ))
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:2]])
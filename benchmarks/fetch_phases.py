@@ -0,0 +1,57 @@
+"""
+compare serial and concurrent phase group fetching
+in smashgg_constructor.get_sgg_phases against the local
+smash.gg stand-in (benchmarks.sgg_stub), which waits
+`latency` seconds before answering each request, and time
+parsing the fetched groups into players and the loss graph
+
+usage: python -m benchmarks.fetch_phases [n_tournaments] [workers] [latency]
+"""
+
+import sys
+import time
+
+import requests
+
+import smashgg_constructor as sgg
+from benchmarks.sgg_stub import SggStub
+from benchmarks.synthetic import make_tournaments
+
+
+def run(n_tournaments=25, workers=16, latency=0.02):
+    data = make_tournaments(n_tournaments)
+    n_groups = len(data['phase_groups'])
+
+    with SggStub(data, latency=latency) as stub:
+        tournaments = [requests.get(url).json() for url in stub.event_urls()]
+        rankings = sgg.get_melee_rankings(api_base=stub.api_base)
+
+        start = time.perf_counter()
+        serial = sgg.get_sgg_phases(tournaments, api_base=stub.api_base)
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        concurrent = sgg.get_sgg_phases(
+            tournaments, workers=workers, api_base=stub.api_base
+        )
+        concurrent_time = time.perf_counter() - start
+
+    assert serial == concurrent, 'concurrent fetch changed phase order'
+
+    start = time.perf_counter()
+    players = sgg.get_sgg_players(serial, rankings)
+    graph = sgg.add_to_graph(serial, players)
+    parse_time = time.perf_counter() - start
+    n_sets = sum(len(p['entities']['sets']) for p in serial)
+
+    print('%d phase groups, %.0f ms latency' % (n_groups, latency * 1000))
+    print('serial:     %.2f s' % serial_time)
+    print('%2d workers: %.2f s' % (workers, concurrent_time))
+    print('speedup:    %.1fx' % (serial_time / concurrent_time))
+    print('parse:      %.3f s for %d sets, %d players, %d losers' % (
+        parse_time, n_sets, len(players), len(graph)))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    run(*[int(a) for a in args[:2]], *[float(a) for a in args[2:3]])
@@ -0,0 +1,93 @@
+"""
+compare serial ingestion of cached tournaments (get_sgg_phases
+from the response cache, then get_sgg_players and add_to_graph)
+against parallel_ingest.ingest_tournaments with 1 to
+`processes` worker processes, on synthetic phase groups stored
+in a temporary sgg_cache.ResponseCache, checking that every
+run gives the same player table and graph, both plain and
+deduplicating sets into integer IDs (seen_sets and a
+player_ids.PlayerIds)
+
+usage: python -m benchmarks.ingest [n_groups] [processes]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import parallel_ingest
+import smashgg_constructor as sgg
+from benchmarks.synthetic import make_phases
+from player_ids import PlayerIds
+from sgg_cache import ResponseCache
+
+GROUPS_PER_TOURNAMENT = 16
+
+
+def as_lists(players, graph):
+    # every key and value, in order
+    return (list(players.items()),
+            [(l, list(w.items())) for l, w in graph.items()])
+
+
+def deduplicated(tournaments, rankings, processes, cache):
+    # parallel ingest with seen_sets and ids, and what those hold after
+    seen_sets, ids = set(), PlayerIds(None)
+    result = parallel_ingest.ingest_tournaments(
+        tournaments, rankings, processes=processes, cache=cache,
+        seen_sets=seen_sets, ids=ids
+    )
+    return as_lists(*result), seen_sets, ids.sgg_ids, ids.history
+
+
+def run(n_groups=2000, processes=None):
+    processes = processes or os.cpu_count() or 1
+    rankings = {1: 'SSBMRank'}
+    phases = make_phases(n_groups=n_groups, n_players=n_groups * 4, rankings=rankings)
+    n_sets = sum(len(p['entities']['sets']) for p in phases)
+    ids = [p['entities']['groups']['id'] for p in phases]
+    tournaments = [
+        {'entities': {'groups': [{'id': i} for i in ids[start:start + GROUPS_PER_TOURNAMENT]]}}
+        for start in range(0, len(ids), GROUPS_PER_TOURNAMENT)
+    ]
+
+    with tempfile.TemporaryDirectory() as path:
+        cache = ResponseCache(path)
+        for i, phase in zip(ids, phases):
+            cache.put(sgg.API_BASE + sgg.PHASE_GROUP_PATH % i, phase)
+        del phases
+
+        start = time.perf_counter()
+        cached = sgg.get_sgg_phases(tournaments, cache=cache)
+        players = sgg.get_sgg_players(cached, rankings)
+        graph = sgg.add_to_graph(cached, players)
+        serial_time = time.perf_counter() - start
+        expected = as_lists(players, graph)
+        seen_sets, ids = set(), PlayerIds(None)
+        players = sgg.get_sgg_players(cached, rankings, ids=ids)
+        graph = sgg.add_to_graph(cached, players, seen_sets=seen_sets)
+        expected_deduplicated = (as_lists(players, graph), seen_sets,
+                                 ids.sgg_ids, ids.history)
+        del cached
+        print('%d phase groups, %d sets, %d players' % (n_groups, n_sets, len(players)))
+        print('serial:       %.2f s' % serial_time)
+
+        n = 1
+        while True:
+            start = time.perf_counter()
+            result = parallel_ingest.ingest_tournaments(
+                tournaments, rankings, processes=n, cache=cache
+            )
+            seconds = time.perf_counter() - start
+            assert as_lists(*result) == expected, 'parallel ingest changed the output'
+            assert deduplicated(tournaments, rankings, n, cache) == expected_deduplicated, \
+                'parallel ingest changed the output with seen_sets and ids'
+            print('%2d processes: %.2f s (%.1fx)' % (n, seconds, serial_time / seconds))
+            if n >= processes:
+                break
+            n = min(n * 2, processes)
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:3]])
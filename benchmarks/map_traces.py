@@ -0,0 +1,88 @@
+"""
+compare dash_script's map figures with one trace per edge
+against merged layer traces: trace count, serialized payload
+size and encode time for 'All' and the average player
+
+render time has to be measured in a browser; pass --html PATH
+to write a page that times Plotly.newPlot on both 'All' figures
+
+usage: python -m benchmarks.map_traces [--html PATH]
+"""
+
+import json
+import sys
+import time
+
+import plotly
+
+import dash_script
+
+PLOTLY_JS = 'https://cdn.plot.ly/plotly-1.58.4.min.js'
+
+PAGE = '''<html><head><script src="%s"></script></head><body>
+<div id="plot" style="width:1200px;height:700px"></div><pre id="out"></pre>
+<script>
+var figures = %s;
+var out = document.getElementById('out');
+Object.keys(figures).reduce(function(done, mode) {
+  return done.then(function() {
+    var start = performance.now();
+    return Plotly.newPlot('plot', figures[mode].data, figures[mode].layout)
+      .then(function() {
+        out.textContent += mode + ': ' +
+          (performance.now() - start).toFixed(0) + ' ms\\n';
+        Plotly.purge('plot');
+      });
+  });
+}, Promise.resolve());
+</script></body></html>
+'''
+
+
+def encode(figure):
+    start = time.perf_counter()
+    payload = json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+    return len(payload), time.perf_counter() - start, payload
+
+
+def figures(state, player):
+    data = state['plot_data']
+    return {
+        'data': [dict(data[i], visible=True) for i in state['trace_index'][player]],
+        'layout': dash_script.layout
+    }
+
+
+def run(html=None):
+    states = {}
+    for merged in (False, True):
+        dash_script.MERGE_MAP_TRACES = merged
+        states['merged' if merged else 'per-edge'] = dash_script.preprocess()
+
+    all_figures = {}
+    for mode, state in states.items():
+        players = [p for p in state['trace_index'] if p != 'All']
+        all_figures[mode] = figures(state, 'All')
+        size, seconds, _ = encode(all_figures[mode])
+        player_sizes = [encode(figures(state, p))[:2] for p in players]
+        print('%-9s All: %5d traces, %8d bytes, %6.1f ms encode' % (
+            mode, len(all_figures[mode]['data']), size, seconds * 1000
+        ))
+        print('%-9s avg player: %8d bytes, %6.2f ms encode' % (
+            mode,
+            sum(s for s, _ in player_sizes) / len(player_sizes),
+            sum(t for _, t in player_sizes) / len(player_sizes) * 1000
+        ))
+
+    if html:
+        with open(html, 'w') as file:
+            file.write(PAGE % (
+                PLOTLY_JS,
+                json.dumps(all_figures, cls=plotly.utils.PlotlyJSONEncoder)
+            ))
+        print('open %s in a browser to time rendering' % html)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    run(args[args.index('--html') + 1] if '--html' in args else None)
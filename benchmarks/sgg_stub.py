@@ -0,0 +1,214 @@
+"""
+a local stand-in for the parts of the smash.gg API that
+smashgg_constructor reads, serving synthetic tournaments
+(see benchmarks.synthetic.make_tournaments) in the same json
+shapes, with optional latency and injected errors:
+
+/rankings?filter={"regional": ...}        ranking series
+/tournament/<slug>?expand[]=event         a tournament's events
+/tournament/<slug>/event/<slug>?expand[]=groups
+                                          an event's phase groups
+/phase_group/<id>?expand[]=sets&expand[]=seeds
+                                          a phase group's sets and seeds
+
+usage: python -m benchmarks.sgg_stub [--port 8000] [--tournaments 10]
+       [--players 1000] [--latency 0] [--error-rate 0] [--seed 0]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic import make_tournaments
+
+
+class SggStub(object):
+    """serve `data` (as output by make_tournaments()) over HTTP
+    on `host`:`port` (0 picks a free port)
+
+    input
+    ---------
+    data: synthetic tournaments, as per make_tournaments()
+    latency (optional): seconds to wait before each response
+    jitter (optional): up to this many more seconds, at random
+    error_rate (optional): fraction of requests answered with
+    `error_status` instead of their json
+    error_status (optional): HTTP status of injected errors
+    seed (optional): seeds the jitter and error draws
+    """
+
+    def __init__(self, data, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_status=503, seed=0, host='127.0.0.1', port=0):
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'errors': 0, 'not_found': 0}
+        self.tournaments = {t['slug']: t for t in data['tournaments']}
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.thread = None
+
+    @property
+    def api_base(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        """serve from a background thread; returns api_base"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.api_base
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def event_urls(self, api_base=None):
+        """URLs of every event's phase group list, in order"""
+        return [
+            '%s/tournament/%s/event/%s?expand[]=groups' % (
+                api_base or self.api_base, t['slug'], e['slug'])
+            for t in self.data['tournaments'] for e in t['events']
+        ]
+
+    def answer(self, path):
+        """return (status, json body) for a request path"""
+        url = urlparse(path)
+        parts = [p for p in url.path.split('/') if p]
+
+        with self.lock:
+            self.counts['requests'] += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.counts['errors'] += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return self.error_status, {'success': False, 'message': 'injected error'}
+
+        body = self.route(parts, parse_qs(url.query))
+        if body is None:
+            with self.lock:
+                self.counts['not_found'] += 1
+            return 404, {'success': False, 'message': 'not found'}
+        return 200, body
+
+    def route(self, parts, query):
+        if parts == ['rankings']:
+            regional = json.loads(query.get('filter', ['{}'])[0]).get('regional')
+            return {'items': {'entities': {'rankingSeries': [
+                r for r in self.data['rankings'] if r['regional'] == regional
+            ]}}}
+
+        if len(parts) == 2 and parts[0] == 'phase_group':
+            try:
+                return self.data['phase_groups'].get(int(parts[1]))
+            except ValueError:
+                return None
+
+        if parts[:1] != ['tournament'] or len(parts) not in (2, 4):
+            return None
+        tournament = self.tournaments.get(parts[1])
+        if tournament is None:
+            return None
+        summary = {k: tournament[k] for k in ('id', 'slug', 'name', 'startAt')}
+        if len(parts) == 2:
+            return {'entities': {
+                'tournament': summary,
+                'event': [dict({k: e[k] for k in ('id', 'slug', 'name')},
+                               tournamentId=tournament['id'])
+                          for e in tournament['events']]
+            }}
+
+        if parts[2] != 'event':
+            return None
+        for e in tournament['events']:
+            if e['slug'] == parts[3]:
+                return {'entities': {
+                    'event': dict({k: e[k] for k in ('id', 'slug', 'name')},
+                                  tournamentId=tournament['id']),
+                    'phase': e['phases'],
+                    'groups': e['groups']
+                }}
+        return None
+
+    def make_handler(self):
+        stub = self
+
+        class SggHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # allow keep-alive
+            # headers and body are separate writes; don't let the
+            # body wait on a delayed ack
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, body = stub.answer(self.path)
+                body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return SggHandler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--tournaments', type=int, default=10)
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--entrants', type=int, default=64)
+    parser.add_argument('--dq-rate', type=float, default=0.02)
+    parser.add_argument('--in-progress', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    data = make_tournaments(
+        args.tournaments, args.players, entrants=args.entrants,
+        dq_rate=args.dq_rate, in_progress=args.in_progress, seed=args.seed
+    )
+    stub = SggStub(data, latency=args.latency, jitter=args.jitter,
+                   error_rate=args.error_rate, error_status=args.error_status,
+                   seed=args.seed, host=args.host, port=args.port)
+    print('serving %d tournaments, %d phase groups at %s' % (
+        len(data['tournaments']), len(data['phase_groups']), stub.api_base))
+    for url in stub.event_urls():
+        print(url)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+time a dash_script worker start, cold (no preprocessing
+cache) and warm (cache present): module import time and
+time until the first map callback has been answered; checks
+that a warm start unpickles the cached state without importing
+numpy
+
+each measurement runs in a fresh interpreter, like a
+gunicorn worker would
+
+usage: python -m benchmarks.startup [runs]
+"""
+
+import glob
+import json
+import os
+import subprocess
+import sys
+
+from prep_cache import CACHE_DIR
+
+WORKER = r'''
+import json, sys, time
+start = time.perf_counter()
+import dash_script
+imported = time.perf_counter()
+numpy = 'numpy' in sys.modules
+client = dash_script.server.test_client()
+client.get('/_dash-layout')
+response = client.post('/_dash-update-component', json={
+    'output': '..playermap.figure...interaction.figure...searched-image.data..',
+    'outputs': [{'id': 'playermap', 'property': 'figure'},
+                {'id': 'interaction', 'property': 'figure'},
+                {'id': 'searched-image', 'property': 'data'}],
+    'inputs': [{'id': 'player-dropdown', 'property': 'value', 'value': 'Mang0'},
+               {'id': 'season-dropdown', 'property': 'value', 'value': 'All'},
+               {'id': 'map-level', 'property': 'data', 'value': dash_script.DEFAULT_LEVEL},
+               {'id': 'ranking-dropdown', 'property': 'value', 'value': dash_script.RANKING}],
+    'changedPropIds': ['player-dropdown.value']
+})
+assert response.status_code == 200, response.status_code
+done = time.perf_counter()
+print(json.dumps({'import': imported - start, 'first_request': done - start,
+                  'numpy': numpy}))
+'''
+
+
+def measure():
+    out = subprocess.run([sys.executable, '-c', WORKER], check=True,
+                         stdout=subprocess.PIPE).stdout
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def clear_cache():
+    for path in glob.glob(os.path.join(CACHE_DIR, 'dash_script-*.pkl')):
+        os.remove(path)
+
+
+def run(runs=3):
+    results = {'cold': [], 'warm': []}
+    for _ in range(runs):
+        clear_cache()
+        results['cold'].append(measure())
+        results['warm'].append(measure())
+        assert not results['warm'][-1]['numpy'], 'warm start imported numpy'
+
+    for mode, timings in results.items():
+        print('%s start: import %.2f s, first request %.2f s (best of %d)' % (
+            mode,
+            min(t['import'] for t in timings),
+            min(t['first_request'] for t in timings),
+            runs
+        ))
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,286 @@
+"""
+time the data pipeline and both dashboards on synthetic
+datasets (see benchmarks.synthetic) of several sizes, and
+compare the results against an earlier run
+
+for each size, the dashboards are imported in a fresh
+interpreter whose working directory holds only the synthetic
+data, so preprocessing starts without a cache; timed are:
+dash_script's preprocessing phases, every server callback
+in both dashboards (first call and repeat, through the Flask
+test client, plus the figure functions called directly) for
+the default data and for a season from the set store, the
+'All' map at each level of detail, dash_script's player
+search, head_to_head's pair query (ranked and unranked
+pairs), and get_sgg_players/add_to_graph on synthetic phase
+groups
+
+clientside callbacks run in the browser and aren't timed
+
+usage: python -m benchmarks.suite [--scales 100,1000,10000]
+       [--out results.json] [--baseline old.json] [--threshold 1.2]
+
+with --baseline, any timing more than `threshold` times its
+baseline (and at least --min-delta seconds slower) is flagged
+as a regression and the exit status is 1
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCALES = [100, 1000, 10000]
+
+
+def best_of(f, repeat=3):
+    """return the fastest of `repeat` timed calls to `f`"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def time_callbacks(prefix, app, dropdown, selections):
+    """time answering every server callback a change of
+    `dropdown` triggers; seconds per selection, first call
+    (cold caches) and repeat; nothing without selections
+    """
+    from benchmarks.callbacks import select
+
+    if not selections:
+        return {}
+    client = app.server.test_client()
+    results = {}
+    for label in ('first', 'repeat'):
+        start = time.perf_counter()
+        for values in selections:
+            select(app, client, values, dropdown)
+        results['%s.callbacks.%s' % (prefix, label)] = (
+            (time.perf_counter() - start) / len(selections)
+        )
+    return results
+
+
+def worker(n_selections=20):
+    """time both dashboards on the data in ./data; run with
+    the synthetic dataset as the working directory
+    """
+    results = {}
+
+    start = time.perf_counter()
+    import dash_script
+    results['dash_script.import'] = time.perf_counter() - start
+    for phase, seconds in dash_script.preprocess_timings.items():
+        results['dash_script.preprocess.%s' % phase] = seconds
+
+    players = ['All'] + list(dash_script.trace_index)[:n_selections]
+    level = dash_script.DEFAULT_LEVEL
+    ranking = dash_script.RANKING
+    results.update(time_callbacks(
+        'dash_script', dash_script.app, 'player-dropdown',
+        [{'player-dropdown': p, 'season-dropdown': 'All', 'map-level': level,
+          'ranking-dropdown': ranking}
+         for p in players]
+    ))
+    # the 'All' map at every level of detail
+    for detail in ['player'] + list(dash_script.level_data):
+        results.update(time_callbacks(
+            'dash_script.map.%s' % detail, dash_script.app, 'player-dropdown',
+            [{'player-dropdown': 'All', 'season-dropdown': 'All', 'map-level': detail,
+              'ranking-dropdown': ranking}]
+        ))
+    for f in (dash_script.update_figure, dash_script.update_figure_2):
+        results['dash_script.%s' % f.__name__] = best_of(
+            lambda: [f(p) for p in players]
+        ) / len(players)
+    # typing the first letters of a few tags into the dropdown
+    queries = [p[:n] for p in players[1:6] for n in (1, 3, 6)]
+    results['dash_script.search'] = best_of(
+        lambda: [dash_script.search.search(q, dash_script.SEARCH_RESULTS)
+                 for q in queries]
+    ) / len(queries)
+    # a season's figures come from the set store instead
+    for season in dash_script.seasons[1:2]:
+        results.update(time_callbacks(
+            'dash_script.season', dash_script.app, 'player-dropdown',
+            [{'player-dropdown': p, 'season-dropdown': season, 'map-level': level,
+              'ranking-dropdown': ranking}
+             for p in players]
+        ))
+    # as are the figures ordered by a computed ranking
+    for other in list(dash_script.rankings)[1:2]:
+        results.update(time_callbacks(
+            'dash_script.ranking', dash_script.app, 'ranking-dropdown',
+            [{'player-dropdown': p, 'season-dropdown': 'All', 'map-level': level,
+              'ranking-dropdown': other}
+             for p in players]
+        ))
+
+    start = time.perf_counter()
+    import head_to_head
+    results['head_to_head.import'] = time.perf_counter() - start
+
+    top = head_to_head.top100[:n_selections]
+    ranking = head_to_head.RANKING
+    pairs = [(p1, p2) for p1 in top for p2 in top[:5] if p1 != p2]
+    results.update(time_callbacks(
+        'head_to_head', head_to_head.app, 'p1-dropdown',
+        [{'p1-dropdown': p1, 'p2-dropdown': p2, 'season-dropdown': 'All',
+          'ranking-dropdown': ranking}
+         for p1, p2 in pairs]
+    ))
+    results['head_to_head.pair_query'] = best_of(
+        lambda: [head_to_head.pair_query.pair(p1, p2) for p1, p2 in pairs]
+    ) / len(pairs)
+    # unranked players' records are built when first compared
+    others = [t for t in head_to_head.graph.tags if t not in head_to_head.top100]
+    others = others[:n_selections]
+    if others:
+        results.update(time_callbacks(
+            'head_to_head.unranked', head_to_head.app, 'p1-dropdown',
+            [{'p1-dropdown': p1, 'p2-dropdown': p2, 'season-dropdown': 'All',
+              'ranking-dropdown': ranking}
+             for p1, p2 in zip(others, top + others[::-1])]
+        ))
+    for season in head_to_head.seasons[1:2]:
+        results.update(time_callbacks(
+            'head_to_head.season', head_to_head.app, 'p1-dropdown',
+            [{'p1-dropdown': p1, 'p2-dropdown': p2, 'season-dropdown': season,
+              'ranking-dropdown': ranking}
+             for p1, p2 in pairs]
+        ))
+    for other in list(head_to_head.rankings)[1:2]:
+        results.update(time_callbacks(
+            'head_to_head.ranking', head_to_head.app, 'ranking-dropdown',
+            [{'p1-dropdown': p1, 'p2-dropdown': p2, 'season-dropdown': 'All',
+              'ranking-dropdown': other}
+             for p1, p2 in pairs]
+        ))
+
+    return results
+
+
+def time_pipeline(n_players, seed=0):
+    """time get_sgg_players and add_to_graph on synthetic
+    phase groups, about one group of 32 per 32 players
+    """
+    import smashgg_constructor as sgg
+    from benchmarks.synthetic import make_phases
+
+    rankings = {1: 'SSBMRank'}
+    phases = make_phases(
+        n_groups=max(10, n_players // 32), n_players=n_players,
+        seed=seed, rankings=rankings
+    )
+    players = sgg.get_sgg_players(phases, rankings)
+    return {
+        'pipeline.get_sgg_players': best_of(
+            lambda: sgg.get_sgg_players(phases, rankings)
+        ),
+        'pipeline.add_to_graph': best_of(
+            lambda: sgg.add_to_graph(phases, players)
+        ),
+    }
+
+
+def run_scale(n_players, seed=0, n_selections=20):
+    from benchmarks.synthetic import write_dataset
+
+    with tempfile.TemporaryDirectory() as path:
+        write_dataset(path, n_players, seed)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            [REPO] + os.environ.get('PYTHONPATH', '').split(os.pathsep)
+        ).rstrip(os.pathsep))
+        out = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.suite',
+             '--worker', '--selections', str(n_selections)],
+            cwd=path, env=env, check=True, stdout=subprocess.PIPE
+        ).stdout
+    results = json.loads(out.decode().splitlines()[-1])
+    results.update(time_pipeline(n_players, seed))
+    return results
+
+
+def compare(results, baseline, threshold=1.2, min_delta=0.001):
+    """return [(scale, metric, baseline s, current s, ratio,
+    regressed)] for every timing in both runs
+    """
+    rows = []
+    for scale, timings in sorted(results['scales'].items(), key=lambda x: int(x[0])):
+        old = baseline.get('scales', {}).get(scale, {})
+        for metric in sorted(timings):
+            if metric not in old:
+                continue
+            ratio = timings[metric] / old[metric] if old[metric] else float('inf')
+            regressed = ratio > threshold and timings[metric] - old[metric] > min_delta
+            rows.append((scale, metric, old[metric], timings[metric], ratio, regressed))
+    return rows
+
+
+def print_results(results):
+    for scale, timings in sorted(results['scales'].items(), key=lambda x: int(x[0])):
+        print('%s players' % scale)
+        for metric in sorted(timings):
+            print('  %-40s %10.2f ms' % (metric, timings[metric] * 1000))
+
+
+def print_comparison(rows):
+    for scale, metric, old, new, ratio, regressed in rows:
+        print('%7s %-40s %10.2f ms %10.2f ms %6.2fx%s' % (
+            scale, metric, old * 1000, new * 1000, ratio,
+            '  REGRESSION' if regressed else ''
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)),
+                        help='comma separated player counts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--selections', type=int, default=20,
+                        help='dropdown selections timed per dashboard')
+    parser.add_argument('--out', help='write results as json here')
+    parser.add_argument('--baseline', help='results json to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    parser.add_argument('--min-delta', type=float, default=0.001)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args.selections)))
+        return 0
+
+    results = {
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'scales': {
+            str(n): run_scale(n, args.seed, args.selections)
+            for n in [int(s) for s in args.scales.split(',')]
+        }
+    }
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent=1, sort_keys=True)
+
+    if not args.baseline:
+        print_results(results)
+        return 0
+
+    with open(args.baseline) as file:
+        rows = compare(results, json.load(file), args.threshold, args.min_delta)
+    print_comparison(rows)
+    regressions = sum(r[-1] for r in rows)
+    print('%d regressions' % regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,441 @@
+"""
+seeded synthetic data in the shapes the dashboards and
+smashgg_constructor read: players/citystates/loss graph json
+files, and smash.gg phase group json objects
+
+activity (how many sets a player enters) follows a power law,
+so a few players have hundreds of opponents and most have a
+handful, as in the 2017 graph; who wins a set depends on skill,
+so the loss graph is lopsided the way real records are
+
+usage: python -m benchmarks.synthetic <out dir> [n_players] [seed]
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+# the dashboards' dropdowns default to these two
+DEFAULT_TAGS = ['Mang0', 'Armada']
+REGIONS = [None, None, None, 'NorCal', 'SoCal']
+# 2017-01-07, a saturday
+FIRST_START = 1483747200
+
+
+def make_tags(n_players):
+    tags = ['Player%06d' % i for i in range(n_players)]
+    tags[:len(DEFAULT_TAGS)] = DEFAULT_TAGS[:n_players]
+    return tags
+
+
+def _activity(rng, n_players, exponent=2.2):
+    # pareto weights, highest for the best players
+    weights = np.sort(rng.pareto(exponent - 1, n_players) + 1)[::-1]
+    return weights / weights.sum()
+
+
+def _skill(rng, n_players):
+    # tag i is the i-th best player, plus noise
+    return np.linspace(3, -3, n_players) + rng.normal(scale=0.5, size=n_players)
+
+
+def make_sets(n_players, n_sets, seed=0):
+    """return (winners, losers) arrays of tag indices for
+    `n_sets` synthetic sets between `n_players` players
+    """
+    rng = np.random.RandomState(seed)
+    activity = _activity(rng, n_players)
+    skill = _skill(rng, n_players)
+
+    a = rng.choice(n_players, size=n_sets, p=activity)
+    b = rng.choice(n_players, size=n_sets, p=activity)
+    keep = a != b
+    a, b = a[keep], b[keep]
+    p_a = 1 / (1 + np.exp(skill[b] - skill[a]))
+    a_wins = rng.uniform(size=len(a)) < p_a
+    return np.where(a_wins, a, b), np.where(a_wins, b, a)
+
+
+def make_dataset(n_players=1000, seed=0, sets_per_player=6, n_cities=None):
+    """return (players, citystates, lossgraph) dicts as in
+    data/players.json, data/citystates.json and
+    data/2017_lossgraph.json, for `n_players` players
+
+    the first 100 tags get SSBMRank 1-100 and a profile image,
+    and about half of everyone has a geocoded city, as in the
+    real data
+    """
+    rng = np.random.RandomState(seed)
+    tags = make_tags(n_players)
+    if n_cities is None:
+        n_cities = max(10, n_players // 20)
+
+    citystates = {
+        'City %d, ST, United States' % i: [
+            round(rng.uniform(25, 49), 6), round(rng.uniform(-124, -67), 6)
+        ]
+        for i in range(n_cities)
+    }
+    cities = list(citystates)
+
+    players = {}
+    for i, tag in enumerate(tags):
+        ranked = i < 100
+        geocoded = ranked or rng.uniform() < 0.55
+        player = {
+            'name': 'Name %d' % i,
+            'citystate': None,
+            'region': REGIONS[rng.randint(len(REGIONS))],
+            'offset': [0.0, 0.0],
+            'state': 'ST',
+            'rankings': {'SSBMRank': i + 1} if ranked else {},
+            'country': 'United States',
+            'image': {
+                'url': 'https://images.example.com/%d.jpg' % i,
+                'width': 600, 'height': 600
+            } if ranked or rng.uniform() < 0.3 else None
+        }
+        if geocoded:
+            city = cities[rng.randint(n_cities)]
+            player['citystate'] = city
+            player['latlon'] = citystates[city]
+        players[tag] = player
+
+    winners, losers = make_sets(n_players, n_players * sets_per_player, seed)
+    lossgraph = {}
+    for w, l in zip(winners.tolist(), losers.tolist()):
+        row = lossgraph.setdefault(tags[l], {})
+        row[tags[w]] = row.get(tags[w], 0) + 1
+
+    return players, citystates, lossgraph
+
+
+def make_set_store(n_players=1000, seed=0, sets_per_player=6,
+                   start=None, days=365):
+    """return a set_store.SetStore of the same sets as
+    make_dataset()'s loss graph, spread evenly at random over
+    `days` days from `start` (unix seconds)
+    """
+    from set_store import SetStore
+
+    if start is None:
+        start = FIRST_START
+    tags = make_tags(n_players)
+    winners, losers = make_sets(n_players, n_players * sets_per_player, seed)
+    rng = np.random.RandomState(seed + 1)
+    times = np.sort(rng.randint(start, start + days * 24 * 60 * 60, len(winners)))
+    store = SetStore(tags)
+    store.add(
+        {'id': k, 'time': t, 'tournament': -1, 'phase_group': -1,
+         'winner': tags[w], 'loser': tags[l]}
+        for k, (t, w, l) in enumerate(zip(
+            times.tolist(), winners.tolist(), losers.tolist()
+        ))
+    )
+    return store
+
+
+def write_dataset(path, n_players=1000, seed=0, set_store=True, **kwargs):
+    """write make_dataset()'s output as `path`/data/*.json,
+    laid out like the repository's data directory, and the
+    same sets with dates as `path`/data/sets.npz
+    """
+    players, citystates, lossgraph = make_dataset(n_players, seed, **kwargs)
+    data_dir = os.path.join(path, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    for name, obj in [('players.json', players),
+                      ('citystates.json', citystates),
+                      ('2017_lossgraph.json', lossgraph)]:
+        with open(os.path.join(data_dir, name), 'w') as file:
+            json.dump(obj, file)
+    if set_store:
+        make_set_store(n_players, seed, kwargs.get('sets_per_player', 6)).save(
+            os.path.join(data_dir, 'sets.npz'))
+    return data_dir
+
+
+def seed_json(entrant_id, i, tag, ranking_ids=(), group_id=None, seed_num=None):
+    """return the json for one seed of a phase group: entrant
+    `entrant_id`, who is player index `i` with gamertag `tag`
+    and ranked i + 1 in every series of `ranking_ids` if they
+    are in the top 100
+    """
+    return {
+        'entrantId': entrant_id,
+        'phaseGroupId': group_id,
+        'seedNum': seed_num,
+        'mutations': {
+            'entrants': {str(entrant_id): {'id': entrant_id, 'name': tag}},
+            'players': {str(i + 1): {
+                'id': i + 1,
+                'gamerTag': tag,
+                'name': 'Name %d' % i,
+                'country': 'United States',
+                'state': 'ST',
+                'region': None,
+                'rankings': [
+                    {'seriesId': r, 'rank': i + 1}
+                    for r in ranking_ids if i < 100
+                ],
+                'images': [{
+                    'height': 600, 'width': 600,
+                    'url': 'https://images.example.com/%d.jpg' % i
+                }] if i < 100 else []
+            }}
+        }
+    }
+
+
+def make_phases(n_groups=50, group_size=32, n_players=1000, seed=0,
+                rankings=None, first_id=0):
+    """return `n_groups` phase group json objects, as returned
+    by the smash.gg phase group endpoint, each with
+    `group_size` entrants drawn by activity from `n_players`
+    players and twice as many sets as entrants between
+    random pairs of them; entrant IDs are player index + 1
+
+    rankings: {ranking id: ranking name}, as per
+    get_melee_rankings(); players get a rank in each
+    """
+    rng = np.random.RandomState(seed)
+    tags = make_tags(n_players)
+    activity = _activity(rng, n_players)
+    skill = _skill(rng, n_players)
+    ranking_ids = list(rankings or {})
+
+    phases = []
+    set_id = first_id * group_size * group_size
+    for g in range(n_groups):
+        entrants = rng.choice(
+            n_players, size=min(group_size, n_players), replace=False, p=activity
+        )
+        seeds = [seed_json(i + 1, i, tags[i], ranking_ids)
+                 for i in entrants.tolist()]
+
+        sets = []
+        pairs = rng.randint(len(entrants), size=(len(entrants) * 2, 2))
+        for a, b in pairs.tolist():
+            if a == b:
+                continue
+            a, b = int(entrants[a]), int(entrants[b])
+            p_a = 1 / (1 + np.exp(skill[b] - skill[a]))
+            winner, loser = (a, b) if rng.uniform() < p_a else (b, a)
+            set_id += 1
+            sets.append({
+                'id': set_id,
+                'winnerId': winner + 1,
+                'loserId': loser + 1,
+                'entrant1Score': 3 if winner == a else int(rng.randint(3)),
+                'entrant2Score': 3 if winner == b else int(rng.randint(3))
+            })
+
+        phases.append({
+            'entities': {
+                'groups': {'id': first_id + g},
+                'seeds': seeds,
+                'sets': sets
+            }
+        })
+    return phases
+
+
+# ranking series the stub API lists, by the `regional` filter
+# smashgg_constructor.RANKINGS_PATHS query them with
+RANKING_SERIES = [
+    {'id': 1, 'name': 'SSBMRank', 'regional': 'state'},
+    {'id': 2, 'name': 'United States', 'regional': 'country'},
+    {'id': 3, 'name': 'NorCal', 'regional': 'subState'},
+]
+
+
+def _bracket_order(n):
+    # standard bracket seeding: 1 v n, 2 v n-1, ... arranged
+    # so the top seeds meet as late as possible
+    order = [0]
+    while len(order) < n:
+        size = len(order) * 2
+        order = [x for s in order for x in (s, size - 1 - s)]
+    return order
+
+
+def make_tournaments(n_tournaments=10, n_players=1000, entrants=64,
+                     pool_size=8, advance=2, dq_rate=0.02, in_progress=0,
+                     seed=0, rankings=RANKING_SERIES, first_start=FIRST_START,
+                     spacing=7 * 24 * 60 * 60):
+    """return a seeded set of synthetic melee tournaments, each
+    one event of round robin pools whose top `advance` players
+    go on to a single elimination top bracket
+
+    entrants are drawn by activity from `n_players` players,
+    so the same players meet across tournaments; pool sets are
+    best of 3 and bracket sets best of 5; a set is a DQ with
+    probability `dq_rate` (loser scored -1, winner 0, as
+    smash.gg reports them); the last `in_progress` tournaments
+    have only played the first round of their bracket
+
+    tournaments start `spacing` seconds apart from `first_start`
+    (unix seconds); pools are played on the first day and the
+    bracket on the second, a round an hour
+
+    output
+    ---------
+    {
+        rankings: [{id, name, regional}] ranking series,
+        tournaments: [{id, slug, name, startAt, events: [{id, slug, name,
+            phases: [{id, name}], groups: [{id, phaseId,
+            displayIdentifier}]}]}],
+        phase_groups: {group id: phase group json object}
+    }
+    """
+    rng = np.random.RandomState(seed)
+    tags = make_tags(n_players)
+    activity = _activity(rng, n_players)
+    skill = _skill(rng, n_players)
+    ranking_ids = [r['id'] for r in rankings]
+    counters = {'entrant': 0, 'set': 0, 'group': 0, 'phase': 0}
+
+    def next_id(kind):
+        counters[kind] += 1
+        return counters[kind]
+
+    def play(a, b, entrant_ids, group_id, round_num, best_of, start,
+             decided=True):
+        s = {
+            'id': next_id('set'),
+            'phaseGroupId': group_id,
+            'round': round_num,
+            'entrant1Id': entrant_ids[a],
+            'entrant2Id': entrant_ids[b],
+            'winnerId': None,
+            'loserId': None,
+            'entrant1Score': None,
+            'entrant2Score': None
+        }
+        if not decided:
+            return s, None
+        s['completedAt'] = start + round_num * 60 * 60
+        a_wins = rng.uniform() < 1 / (1 + np.exp(skill[b] - skill[a]))
+        if rng.uniform() < dq_rate:
+            winner_score, loser_score = 0, -1
+        else:
+            winner_score, loser_score = best_of // 2 + 1, int(rng.randint(best_of // 2 + 1))
+        winner, loser = (a, b) if a_wins else (b, a)
+        s.update({
+            'winnerId': entrant_ids[winner],
+            'loserId': entrant_ids[loser],
+            'entrant1Score': winner_score if a_wins else loser_score,
+            'entrant2Score': loser_score if a_wins else winner_score
+        })
+        return s, winner
+
+    def group_json(group_id, players, entrant_ids, sets):
+        return {
+            'entities': {
+                'groups': {'id': group_id},
+                'seeds': [
+                    seed_json(entrant_ids[i], i, tags[i], ranking_ids,
+                              group_id=group_id, seed_num=n + 1)
+                    for n, i in enumerate(players)
+                ],
+                'sets': sets
+            }
+        }
+
+    tournaments = []
+    phase_groups = {}
+    for t in range(n_tournaments):
+        # entrants in seeding order, best player first
+        players = sorted(rng.choice(
+            n_players, size=min(entrants, n_players), replace=False, p=activity
+        ).tolist())
+        entrant_ids = {i: next_id('entrant') for i in players}
+        start = first_start + t * spacing
+        pools_phase = {'id': next_id('phase'), 'name': 'Pools'}
+        bracket_phase = {'id': next_id('phase'), 'name': 'Top Bracket'}
+        groups = []
+
+        # snake seed the entrants into pools
+        n_pools = max(1, -(-len(players) // pool_size))
+        pools = [[] for _ in range(n_pools)]
+        for k, i in enumerate(players):
+            row, col = divmod(k, n_pools)
+            pools[col if row % 2 == 0 else n_pools - 1 - col].append(i)
+
+        advancing = []
+        for n, pool in enumerate(pools):
+            group_id = next_id('group')
+            sets = []
+            wins = dict.fromkeys(pool, 0)
+            for x in range(len(pool)):
+                for y in range(x + 1, len(pool)):
+                    s, winner = play(pool[x], pool[y], entrant_ids, group_id,
+                                     1, 3, start)
+                    sets.append(s)
+                    wins[winner] += 1
+            standings = sorted(pool, key=lambda i: (-wins[i], i))
+            advancing.append(standings[:advance])
+            phase_groups[group_id] = group_json(group_id, pool, entrant_ids, sets)
+            groups.append({'id': group_id, 'phaseId': pools_phase['id'],
+                           'displayIdentifier': str(n + 1)})
+
+        # pool winners seed first, then runners up, and so on
+        bracket = [i for place in range(advance)
+                   for i in sorted(a[place] for a in advancing if len(a) > place)]
+        group_id = next_id('group')
+        size = 1
+        while size < len(bracket):
+            size *= 2
+        alive = [bracket[k] if k < len(bracket) else None
+                 for k in _bracket_order(size)]
+        sets = []
+        round_num = 1
+        decided = t < n_tournaments - in_progress
+        while len(alive) > 1:
+            # an unfinished bracket lists its next sets undecided
+            round_decided = decided or round_num == 1
+            next_round = []
+            for a, b in zip(alive[::2], alive[1::2]):
+                if a is None or b is None:
+                    # a bye
+                    next_round.append(b if a is None else a)
+                    continue
+                s, winner = play(a, b, entrant_ids, group_id, round_num, 5,
+                                 start + 24 * 60 * 60, decided=round_decided)
+                sets.append(s)
+                next_round.append(winner)
+            if not round_decided:
+                break
+            alive = next_round
+            round_num += 1
+        phase_groups[group_id] = group_json(group_id, bracket, entrant_ids, sets)
+        groups.append({'id': group_id, 'phaseId': bracket_phase['id'],
+                       'displayIdentifier': 'Top'})
+
+        tournaments.append({
+            'id': t + 1,
+            'slug': 'synthetic-%d' % (t + 1),
+            'name': 'Synthetic %d' % (t + 1),
+            'startAt': start,
+            'events': [{
+                'id': t + 1,
+                'slug': 'melee-singles',
+                'name': 'Melee Singles',
+                'phases': [pools_phase, bracket_phase],
+                'groups': groups
+            }]
+        })
+
+    return {
+        'rankings': rankings,
+        'tournaments': tournaments,
+        'phase_groups': phase_groups
+    }
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if not args:
+        sys.exit(__doc__)
+    print(write_dataset(args[0], *[int(a) for a in args[1:3]]))
@@ -1,192 +1,170 @@
 ##### IMPORTS #####
+# numpy, pandas and the data loaders are only imported
+# inside preprocess(), which a warm cache skips entirely
 import json
-import numpy as np
-import pandas as pd
-import plotly
+import os
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-import pandas as pd
-import plotly.graph_objs as go
+import metrics
+from figure_cache import CallbackCache
+from prep_cache import PhaseTimer, cached_state
+from response_pipeline import CompressedResponses, use_fast_encoder
 
 ##### DATA LOADING #####
 
-with open('data/players.json') as file:
-    players = json.load(file)
-with open('data/citystates.json') as file:
-    cs_geo = json.load(file)
-with open('data/2017_lossgraph.json') as file:
-    lossgraph = json.load(file)
-with open('data/2017_wingraph.json') as file:
-    wingraph = json.load(file)
+# Seconds each phase of this worker's startup takes
+startup_timer = PhaseTimer()
+
+DATA_FILES = [
+    'data/players.json',
+    'data/citystates.json',
+    'data/2017_lossgraph.json'
+]
+# Sets by date, as saved by set_store.SetStore; when present,
+# a season dropdown shows any year or half year in it
+SETS_FILE = 'data/sets.npz'
+# bump whenever preprocess() changes what it returns
+PREPROCESS_VERSION = 10
+
+# Ranking series players are ordered and filtered by: the
+# SSBMRank from smash.gg, or one of ratings.METHODS computed
+# from the results ('Elo' and 'Glicko' need SETS_FILE); the
+# ranking dropdown offers the others too
+RANKING = 'SSBMRank'
+# Number of players a computed ranking ranks
+RATED_PLAYERS = 100
 
 ##### UDF's #####
 
 def get_ranking(player_name, player_info):
     #Find any ranked player's ranking, return zero for unranked
-    ranking = player_info[player_name]['rankings'].get('SSBMRank', 0)
+    ranking = player_info[player_name]['rankings'].get(RANKING, 0)
 
     return ranking
 
-def find_2way_interactions(player_name, wins, losses):
+def find_2way_interactions(player_name, graph):
     # Only returns interactions for which both players have won
-    # and lost to one another
-    interaction_set = set([k for k,v in wins.items()]) & \
-                        set([k for k,v in losses.items()])
-
-    return interaction_set
-
-##### PREPROCESSING #####
-
-# Add jitter to each player's lat lon coordinates
-for p in players:
-    isnorcal = issocal = False
-    if players[p]['citystate'] is None and players[p]['region'] == 'NorCal':
-        isnorcal = True
-    elif players[p]['citystate'] is None and players[p]['region'] == 'SoCal':
-        issocal = True
-
-    players[p]['offset'] = (
-        np.random.normal(scale=0.2) + isnorcal - issocal,
-        np.random.normal(scale=0.2) - isnorcal
+    # and lost to one another, as sorted graph IDs
+    import numpy as np
+    return np.intersect1d(
+        graph.beat(player_name)[0], graph.lost_to(player_name)[0],
+        assume_unique=True
     )
 
-# Make a data frame for players and their coordinates
-playerDF2 = pd.DataFrame(
-    columns=['tag', 'lat', 'lon']
-)
-
-top100 = sorted(
-    [p for p in players if players[p]['rankings'].get('SSBMRank') is not None],
-    key=lambda x: players[x]['rankings']['SSBMRank']
-)
-
-for i, p in enumerate(top100):
-    latlon = players[p].get('latlon')
-    if latlon is not None:
-        playerDF2.loc[i, ['tag', 'lat', 'lon']] = (
-            p,
-            latlon[0] + players[p]['offset'][0],
-            latlon[1] + players[p]['offset'][1]
-        )
-playerDF2.reset_index(drop=True, inplace=True)
-
-# Lines
-plot_data = list()
-interaction_data = list()
-interaction_names = list()
-
-for p in top100:
-    # add neutral lines
-    for loss in [
-        match for match in lossgraph[p] if match in top100
-        and players[match].get('latlon') is not None
-        and players[p].get('latlon') is not None
-    ]:
-        plot_data.append(
-            dict(
-                type='scattergeo',
-                mode='lines+markers',
-                text=[p, loss],
-                hoverinfo='text',
-                lat=[
-                    players[p]['latlon'][0] + players[p]['offset'][0],
-                    players[loss]['latlon'][0] + players[loss]['offset'][0]
-                ],
-                lon=[
-                    players[p]['latlon'][1] + players[p]['offset'][1],
-                    players[loss]['latlon'][1] + players[loss]['offset'][1]
-                ],
-                line=dict(
-                    width = 1,
-                    color='rgba(68, 68, 200, 0.05)'
-                ),
-                marker=dict(
-                    size=3,
-                    color='rgb(107,107,200)',
-                    opacity=1
-                )
-            )
-        )
-    # add green lines
-    for loss in [
-        match for match in lossgraph[p] if match in top100
-        and players[match].get('latlon') is not None
-        and players[p].get('latlon') is not None
-    ]:
-        plot_data.append(
-            dict(
-                type='scattergeo',
-                mode='lines+markers',
-                text=[p, loss],
-                hoverinfo='text',
-                lat=[
-                    players[p]['latlon'][0] + players[p]['offset'][0],
-                    players[loss]['latlon'][0] + players[loss]['offset'][0]
-                ],
-                lon=[
-                    players[p]['latlon'][1] + players[p]['offset'][1],
-                    players[loss]['latlon'][1] + players[loss]['offset'][1]
-                ],
-                line=dict(
-                    width = 1,
-                    color='rgba(68, 200, 68, 0.3)'
-                ),
-                marker=dict(
-                    size=3,
-                    color='rgb(107,107,200)',
-                    opacity=1
-                ),
-                visible=False
-            )
-        )
-    # add red lines
-    for win in [
-        match for match in wingraph[p] if match in top100
-        and players[match].get('latlon') is not None
-        and players[p].get('latlon') is not None
-    ]:
-        plot_data.append(
-            dict(
-                type='scattergeo',
-                mode='lines+markers',
-                text=[p, loss],
-                hoverinfo='text',
-                lat=[
-                    players[p]['latlon'][0] + players[p]['offset'][0],
-                    players[win]['latlon'][0] + players[win]['offset'][0]
-                ],
-                lon=[
-                    players[p]['latlon'][1] + players[p]['offset'][1],
-                    players[win]['latlon'][1] + players[win]['offset'][1]
-                ],
-                line=dict(
-                    width = 1,
-                    color='rgba(200, 68, 68, 0.3)'
-                ),
-                marker=dict(
-                    size=3,
-                    color='rgb(107,107,200)',
-                    opacity=1
-                ),
-                visible=False
-            )
+# Line colors of the map layers
+NEUTRAL_LINE = 'rgba(68, 68, 200, 0.05)'
+WIN_LINE = 'rgba(68, 200, 68, 0.3)'
+LOSS_LINE = 'rgba(200, 68, 68, 0.3)'
+
+# Pack each map layer into a single trace with edges separated
+# by gaps, rather than one trace per edge; plotly.js renders
+# per trace, so this keeps the 'All' figure to a handful
+MERGE_MAP_TRACES = True
+
+# Draw the 'All' map by region rather than by player, at the
+# map_levels level for the current zoom: (smallest projection
+# scale, level), where scale 1 shows the whole world and
+# 'player' draws every ranked player's lines
+AGGREGATE_MAP = True
+MAP_ZOOM_LEVELS = [(0, 'state'), (3, 'grid'), (8, 'player')]
+# Heaviest pairs of regions drawn per level
+MAX_REGION_EDGES = 500
+REGION_LINE = 'rgba(68, 68, 200, 0.4)'
+REGION_MARKER = 'rgb(107,107,200)'
+
+def edge_trace(text, lat, lon, color, visible=True, width=1):
+    # Map trace for match lines, hover text naming their players
+    trace = dict(
+        type='scattergeo',
+        mode='lines+markers',
+        text=text,
+        hoverinfo='text',
+        lat=lat,
+        lon=lon,
+        line=dict(
+            width = width,
+            color=color
+        ),
+        marker=dict(
+            size=3,
+            color='rgb(107,107,200)',
+            opacity=1
         )
-    # Add interaction plot data
-    wins, losses = (wingraph[p], lossgraph[p])
-    names = set([name for name in wins.keys()]) | set([name for name in losses.keys()])
+    )
+    if not visible:
+        trace['visible'] = False
+    return trace
+
+def merged_trace(src, dst, lat, lon, names, color, visible=True, width=1):
+    # Single map trace for many match lines, given as arrays of
+    # graph IDs; each line is (from, to, gap) in lat, lon and text,
+    # so hovering still names the players at either end
+    import numpy as np
+    n = len(src)
+    lats, lons, text = (np.full((n, 3), None, dtype=object) for _ in range(3))
+    lats[:, 0], lats[:, 1] = lat[src], lat[dst]
+    lons[:, 0], lons[:, 1] = lon[src], lon[dst]
+    text[:, 0], text[:, 1] = names[src], names[dst]
+    return edge_trace(
+        text.ravel().tolist(),
+        lats.ravel().tolist(), lons.ravel().tolist(), color, visible, width
+    )
 
-    interactions = dict()
-    for name in names:
-        ranking = get_ranking(name, players)
-        if ranking > 0:
-            interactions[name] = (wins.get(name, 0), losses.get(name, 0), ranking)
+def region_traces(losses, groups, regions):
+    # Map traces of the sets between regions, one per line
+    # width, heavier edges wider, and a marker per region sized
+    # by its players; groups holds each graph ID's region ID
+    import numpy as np
+    from map_levels import region_edges, width_classes
+    labels = np.array(regions['labels'], dtype=object)
+    lat, lon = np.array(regions['lat']), np.array(regions['lon'])
+    sizes = np.array(regions['sizes'])
+    src, dst, sets, inside = region_edges(
+        losses, groups, len(labels), MAX_REGION_EDGES
+    )
 
-    sorted_interactions = sorted(list(interactions.items()), key=lambda x: x[1][2], reverse=True)
+    traces = []
+    widths = width_classes(sets)
+    for c in np.unique(widths).tolist():
+        edges = widths == c
+        traces.append(merged_trace(
+            src[edges], dst[edges], lat, lon, labels, REGION_LINE, width=1 + 1.5 * c
+        ))
+    played = np.bincount(np.concatenate([src, dst]), np.concatenate([sets, sets]),
+                         len(labels)) + inside
+    shown = np.flatnonzero(played > 0)
+    traces.append(dict(
+        type='scattergeo',
+        mode='markers',
+        text=['%s: %d players, %d sets' % (labels[i], sizes[i], played[i])
+              for i in shown],
+        hoverinfo='text',
+        lat=lat[shown].tolist(),
+        lon=lon[shown].tolist(),
+        marker=dict(
+            size=(3 + 12 * np.sqrt(sizes[shown] / max(sizes.max(), 1))).tolist(),
+            color=REGION_MARKER,
+            opacity=0.8
+        )
+    ))
+    return traces
+
+def interaction_bars(graph, player, ranks):
+    # Wins and losses bars against ranked opponents,
+    # lowest ranked first
+    import numpy as np
+    if player in graph:
+        ids, win_counts, loss_counts = graph.interactions(player)
+    else:
+        ids = win_counts = loss_counts = np.zeros(0, dtype=np.int32)
+    ranked = ranks[ids] > 0
+    ids, win_counts, loss_counts = ids[ranked], win_counts[ranked], loss_counts[ranked]
+    order = np.argsort(-ranks[ids], kind='stable')
 
-    names = [x[0] for x in sorted_interactions]
-    win_heights = [x[1][0] for x in sorted_interactions]
-    loss_heights = [-x[1][1] for x in sorted_interactions]
+    names = graph.tag_array[ids[order]].tolist()
+    win_heights = win_counts[order].tolist()
+    loss_heights = (-loss_counts[order]).tolist()
 
     wins = {
         'y': names,
@@ -208,30 +186,276 @@ for p in top100:
             'color': 'rgba(200, 68, 68, 0.8)'
         }
     };
+    return [wins, losses]
 
-    interaction_data.append([wins, losses]);
-    interaction_names.append(p)
+##### PREPROCESSING #####
 
-## End of player loop ##
+def preprocess():
+    """load the data and build everything the dashboard
+    serves: map traces, the per-player trace index, and the
+    interaction bars; cached by cached_state() below
+    """
+    import numpy as np
+    import pandas as pd
+    from snapshot import load_data
+
+    timer = PhaseTimer()
+
+    # Read from the compiled snapshot (python snapshot.py build) if
+    # there is an up to date one, otherwise from the json files;
+    # the win graph is the transpose of the loss graph
+    players, cs_geo, graph = load_data()
+    timer.lap('load')
+
+    # Rank the players by their results too, by every method
+    # there's data for
+    import ratings
+    store = None
+    if os.path.exists(SETS_FILE):
+        from set_store import SetStore
+        store = SetStore.load(SETS_FILE)
+    rankings = {RANKING: None}
+    for method in ratings.METHODS:
+        if method != 'PageRank' and store is None:
+            continue
+        scores = ratings.scores(method, graph, store)
+        rankings[method] = ratings.add_rankings(players, scores, method, RATED_PLAYERS)
+    # {series: {tag: rank}} of every ranked player, for the
+    # ranking dropdown
+    rankings = {
+        series: {
+            t: players[t]['rankings'][series]
+            for t in (ranked if ranked is not None else players)
+            if series in players[t]['rankings']
+        }
+        for series, ranked in rankings.items()
+    }
+    timer.lap('ratings')
+
+    # Add jitter to each player's lat lon coordinates, as
+    # floats so the cached state unpickles without numpy
+    for p in players:
+        isnorcal = issocal = False
+        if players[p]['citystate'] is None and players[p]['region'] == 'NorCal':
+            isnorcal = True
+        elif players[p]['citystate'] is None and players[p]['region'] == 'SoCal':
+            issocal = True
+
+        players[p]['offset'] = (
+            float(np.random.normal(scale=0.2) + isnorcal - issocal),
+            float(np.random.normal(scale=0.2) - isnorcal)
+        )
+
+    timer.lap('jitter')
+
+    # Make a data frame for players and their coordinates
+    playerDF2 = pd.DataFrame(
+        columns=['tag', 'lat', 'lon']
+    )
+
+    top100 = sorted(
+        [p for p in players if players[p]['rankings'].get(RANKING) is not None],
+        key=lambda x: players[x]['rankings'][RANKING]
+    )
+
+    for i, p in enumerate(top100):
+        latlon = players[p].get('latlon')
+        if latlon is not None:
+            playerDF2.loc[i, ['tag', 'lat', 'lon']] = (
+                p,
+                latlon[0] + players[p]['offset'][0],
+                latlon[1] + players[p]['offset'][1]
+            )
+    playerDF2.reset_index(drop=True, inplace=True)
 
-# Create boolean vectors for filtering map
-filters = {
-    'All': [
-        True if p['line']['color'] == 'rgba(68, 68, 200, 0.05)'
-        else False for p in plot_data
+    timer.lap('playerDF2')
+
+    # Lines
+    plot_data = list()
+    interaction_data = list()
+    interaction_names = list()
+
+    # Ranked players with known coordinates, by graph ID
+    ranks = graph.rankings(players, RANKING)
+    on_map = (ranks > 0) & np.array(
+        [players[t].get('latlon') is not None for t in graph.tags]
+    )
+    lat = np.full(len(graph), np.nan)
+    lon = np.full(len(graph), np.nan)
+    for i in np.flatnonzero(on_map):
+        p = graph.tags[i]
+        lat[i] = players[p]['latlon'][0] + players[p]['offset'][0]
+        lon[i] = players[p]['latlon'][1] + players[p]['offset'][1]
+
+    # Edges between mapped players as (from, to) graph ID arrays,
+    # ordered by the ranking of the player they're drawn from:
+    # a loss from p to q is drawn neutral in 'All' and green for q,
+    # a win from p over q is drawn red for q
+    def mapped_edges(matrix):
+        coo = matrix.tocoo()
+        keep = on_map[coo.row] & on_map[coo.col]
+        src, dst = coo.row[keep], coo.col[keep]
+        order = np.lexsort((dst, ranks[src]))
+        return src[order], dst[order]
+
+    loss_src, loss_dst = mapped_edges(graph.losses)
+    win_src, win_dst = mapped_edges(graph.wins)
+
+    # Indices into plot_data of the lines shown for each dropdown
+    # entry: 'All' gets the neutral lines, a player gets the
+    # colored lines ending at them
+    trace_index = {'All': []}
+    trace_index.update((p, []) for p in playerDF2['tag'])
+
+    layers = [
+        ('All', loss_src, loss_dst, NEUTRAL_LINE, True),
+        (None, loss_src, loss_dst, WIN_LINE, False),
+        (None, win_src, win_dst, LOSS_LINE, False),
     ]
-}
-for i in range(len(playerDF2)):
-    player_info = playerDF2.loc[i, :]
-    name, latitude, longitude = (x for x in list(player_info))
-    filtered_lines = [True if latitude == x['lat'][1] and longitude == x['lon'][1]
-                      and x['line']['color'] != 'rgba(68, 68, 200, 0.05)'
-                      else False for x in plot_data]
-    filters[name] = filtered_lines
+    for view, src, dst, color, visible in layers:
+        if MERGE_MAP_TRACES:
+            # one trace per layer and player it's shown for
+            if view is not None:
+                groups = [(view, np.arange(len(src)))]
+            else:
+                order = np.argsort(dst, kind='stable')
+                bounds = np.flatnonzero(np.diff(dst[order])) + 1
+                groups = [
+                    (graph.tags[dst[g[0]]], g)
+                    for g in np.split(order, bounds) if len(g)
+                ]
+            for key, edges in groups:
+                trace_index[key].append(len(plot_data))
+                plot_data.append(merged_trace(
+                    src[edges], dst[edges], lat, lon, graph.tag_array,
+                    color, visible
+                ))
+        else:
+            for i, j in zip(src.tolist(), dst.tolist()):
+                trace_index[view or graph.tags[j]].append(len(plot_data))
+                plot_data.append(edge_trace(
+                    [graph.tags[i], graph.tags[j]],
+                    [lat[i], lat[j]], [lon[i], lon[j]], color, visible
+                ))
+    timer.lap('plot_data')
+
+    # Region level maps for 'All', over every player with
+    # coordinates rather than only the ranked ones, for the
+    # levels the zoom ladder draws
+    level_data = {}
+    regions = {}
+    region_of = {}
+    if AGGREGATE_MAP:
+        import map_levels
+        for level in [l for _, l in MAP_ZOOM_LEVELS if l in map_levels.LEVELS]:
+            groups, labels, r_lat, r_lon, sizes = map_levels.group_players(
+                graph.tags, players, level
+            )
+            regions[level] = {'labels': labels, 'lat': r_lat.tolist(),
+                              'lon': r_lon.tolist(), 'sizes': sizes.tolist()}
+            level_data[level] = region_traces(graph.losses, groups, regions[level])
+            for i in np.flatnonzero(groups >= 0).tolist():
+                region_of.setdefault(graph.tags[i], {})[level] = int(groups[i])
+        timer.lap('levels')
+
+    for p in top100:
+        # Add interaction plot data, ranked opponents only,
+        # lowest ranked first
+        interaction_data.append(interaction_bars(graph, p, ranks))
+        interaction_names.append(p)
+    # Index into interaction_data of each player's bars
+    interaction_index = {p: i for i, p in enumerate(interaction_names)}
+
+    ## End of player loop ##
+    timer.lap('interaction_data')
+
+    # Everyone with sets can be searched for and selected: map
+    # positions for all, and a search index listing ranked
+    # players first, then the rest by sets played
+    from player_search import PlayerSearch
+    positions = {
+        t: [float(players[t]['latlon'][0] + players[t]['offset'][0]),
+            float(players[t]['latlon'][1] + players[t]['offset'][1])]
+        for t in graph.tags if t in players and players[t].get('latlon') is not None
+    }
+    images = {
+        t: players[t]['image']['url']
+        for t in graph.tags if t in players and players[t]['image'] is not None
+    }
+    played = np.asarray(graph.losses.sum(axis=0) + graph.losses.sum(axis=1).T).ravel()
+    search = PlayerSearch(
+        graph.tags,
+        [players[t]['name'] if t in players else None for t in graph.tags],
+        np.where(ranks > 0, ranks, ranks.max(initial=0) + 1 + played.max(initial=0) - played)
+    )
+    timer.lap('search')
+
+    # Seasons the set store has sets for, if there is one
+    seasons = []
+    if store is not None:
+        seasons = store.seasons()
+        timer.lap('seasons')
+
+    return {
+        # callbacks only ever look up dropdown entries
+        'players': {p: players[p] for p in top100},
+        'top100': top100,
+        'playerDF2': playerDF2.to_dict('list'),
+        'plot_data': plot_data,
+        'interaction_data': interaction_data,
+        'interaction_names': interaction_names,
+        'interaction_index': interaction_index,
+        'trace_index': trace_index,
+        'level_data': level_data,
+        'regions': regions,
+        'region_of': region_of,
+        'positions': positions,
+        'images': images,
+        'rankings': rankings,
+        'search': search,
+        'seasons': seasons,
+        'timings': timer.timings
+    }
+
+
+state = cached_state(
+    'dash_script', preprocess,
+    DATA_FILES + [SETS_FILE] * os.path.exists(SETS_FILE),
+    version=(PREPROCESS_VERSION, MERGE_MAP_TRACES, RANKING, RATED_PLAYERS,
+             AGGREGATE_MAP, MAX_REGION_EDGES, json.dumps(MAP_ZOOM_LEVELS))
+)
+players = state['players']
+top100 = state['top100']
+plot_data = state['plot_data']
+interaction_data = state['interaction_data']
+interaction_names = state['interaction_names']
+interaction_index = state['interaction_index']
+trace_index = state['trace_index']
+level_data = state['level_data']
+search = state['search']
+images = state['images']
+seasons = state['seasons']
+rankings = state['rankings']
+# Map level the whole world is drawn at
+DEFAULT_LEVEL = MAP_ZOOM_LEVELS[0][1] if level_data else 'player'
+# Seconds each preprocessing phase took when the cache was built
+preprocess_timings = state['timings']
+startup_timer.lap('preprocess')
+
+
+def __getattr__(name):
+    # playerDF2 is rebuilt on first access so that
+    # pandas isn't imported on a warm start
+    if name == 'playerDF2':
+        import pandas as pd
+        return pd.DataFrame(state['playerDF2'], columns=['tag', 'lat', 'lon'])
+    raise AttributeError(name)
+
 
 # Create default layouts for all plots
 layout = dict(
-    title = '<b>Super Smash Bros. Melee Tournament Matches (2017)</b><br><i>SSBMRank Top 100</i>',
+    title = '<b>Super Smash Bros. Melee Tournament Matches (2017)</b><br><i>%s Top %d</i>' % (
+        RANKING, RATED_PLAYERS),
     showlegend=False,
     geo = dict(
         scope='world',
@@ -246,7 +470,9 @@ layout = dict(
         subunitcolor='rgb(0, 0, 0)',
     ),
     # paper_bgcolor='rgb(255, 255, 255)',
-    plot_bgcolor='rgb(240, 240, 240)'
+    plot_bgcolor='rgb(240, 240, 240)',
+    # keep the zoom when the figure is swapped for another level
+    uirevision='map'
 )
 
 interaction_layout = {
@@ -269,11 +495,28 @@ interaction_layout = {
 }
 
 # Initialize the figures for the plots
-fig = dict(data=plot_data, layout=layout)
+fig = dict(data=level_data.get(DEFAULT_LEVEL, plot_data), layout=layout)
 fig2 = dict(data=interaction_data, layout=interaction_layout)
 
 ##### DASHBOARD #####
 
+# Memory cap for cached figure responses, and whether to build
+# them all at startup rather than on each first selection
+FIGURE_CACHE_BYTES = 64 * 1024 * 1024
+WARM_FIGURE_CACHE = False
+
+# Whether to serve timings, payload sizes and cache hit rates
+# on /metrics, and to add a Server-Timing header to responses
+METRICS = True
+TIMING_HEADER = False
+
+# Picture url for each default dropdown entry that has one;
+# update_selection() sends those of searched players
+player_images = {
+    p: players[p]['image']['url'] for p in trace_index
+    if p != 'All' and players[p]['image'] is not None
+}
+
 app = dash.Dash()
 server = app.server
 app.layout = html.Div(
@@ -298,8 +541,8 @@ app.layout = html.Div(
                         [
                             {'value':f, 'label':f}
                             for f in sorted(
-                                filters.keys(),
-                                key=lambda x:players[x]['rankings']['SSBMRank']
+                                trace_index.keys(),
+                                key=lambda x:players[x]['rankings'][RANKING]
                                 if x != 'All' else 0
                             )
                         ],
@@ -310,6 +553,34 @@ app.layout = html.Div(
                 style={
                     'padding-top':'50px'
                 }
+            ),
+                html.Div([
+                dcc.Dropdown(
+                    id='season-dropdown',
+                    options=
+                        [{'value': 'All', 'label': '2017 (default)'}] +
+                        [{'value': s, 'label': s} for s in seasons],
+                    value='All',
+                    clearable=False,
+                )],
+                style={
+                    'padding-top':'10px',
+                    # only when there are seasons to pick
+                    'display': 'block' if seasons else 'none'
+                }
+            ),
+                html.Div([
+                dcc.Dropdown(
+                    id='ranking-dropdown',
+                    options=[{'value': r, 'label': r} for r in rankings],
+                    value=RANKING,
+                    clearable=False,
+                )],
+                style={
+                    'padding-top':'10px',
+                    # only when there's more than one ranking
+                    'display': 'block' if len(rankings) > 1 else 'none'
+                }
             )
             ],
             style={
@@ -331,88 +602,113 @@ app.layout = html.Div(
             ),
             style={'width': '80%'},
             id='output'
-        )
+        ),
+        # Static lookups for the client side callbacks, sent once
+        dcc.Store(id='player-images', data=player_images),
+        # Picture url of the last searched player selected
+        dcc.Store(id='searched-image', data={}),
+        # Map level for the current zoom, set in the browser
+        dcc.Store(id='map-level', data=DEFAULT_LEVEL)
     ],
     style={'background-color': 'rgba(29,128,159,.9)'}
 )
 
 
-# callback for image visibility
-@app.callback(
-    dash.dependencies.Output('player-img', 'style'),
-    [dash.dependencies.Input('player-dropdown', 'value')]
+# Player picture, looked up in the browser from the preloaded
+# store, or for searched players the one update_selection() sent
+app.clientside_callback(
+    """
+    function(player, searched, images) {
+        var url = images[player] || searched[player];
+        if (!url) {
+            return [null, {'visibility': 'hidden'}];
+        }
+        return [url, {'visibility': 'visible'}];
+    }
+    """,
+    [dash.dependencies.Output('player-img', 'src'),
+     dash.dependencies.Output('player-img', 'style')],
+    [dash.dependencies.Input('player-dropdown', 'value'),
+     dash.dependencies.Input('searched-image', 'data')],
+    [dash.dependencies.State('player-images', 'data')]
 )
-def inset_image(player):
-    if player == 'All':
-        return {'visibility':'hidden'}
-    elif players[player]['image'] is None:
-        return {'visibility':'hidden'}
-    else:
-        return {'visibility':'visible'}
 
 
-# callback for image url
-@app.callback(
-    dash.dependencies.Output('player-img', 'src'),
-    [dash.dependencies.Input('player-dropdown', 'value')]
-)
-def inset_image(player):
+# Map level for the zoom, from the projection scale in the
+# map's relayout events; only changes when the level does,
+# so panning and zooming within a level send no requests
+if level_data:
+    app.clientside_callback(
+        """
+        function(relayout, level) {
+            var scale = relayout && relayout['geo.projection.scale'];
+            if (scale === undefined) {
+                return window.dash_clientside.no_update;
+            }
+            var levels = %s;
+            var zoomed = levels[0][1];
+            for (var i = 0; i < levels.length; i++) {
+                if (scale >= levels[i][0]) {
+                    zoomed = levels[i][1];
+                }
+            }
+            return zoomed === level ? window.dash_clientside.no_update : zoomed;
+        }
+        """ % json.dumps(MAP_ZOOM_LEVELS),
+        dash.dependencies.Output('map-level', 'data'),
+        [dash.dependencies.Input('playermap', 'relayoutData')],
+        [dash.dependencies.State('map-level', 'data')]
+    )
+
+
+def map_layout(player, period='2017'):
+    # Map layout titled for a player and the period shown
+    new_layout = dict(layout)
     if player != 'All':
-        return players[player]['image'].get('url')
+        new_layout['title'] = '<b>%s Tournament Matches for %s</b>' % (period, player)
+    elif period != '2017':
+        new_layout['title'] = layout['title'].replace('(2017)', '(%s)' % period)
+    return new_layout
+
+def update_figure(player, level='player'):
+    # Set up lines; copies, so the shared traces stay hidden,
+    # or the regions of a map level for 'All'
+    if player == 'All' and level in level_data:
+        filtered_data = level_data[level]
     else:
-        return
-
+        filtered_data = [dict(plot_data[i], visible=True) for i in trace_index[player]]
 
-# Callback for the scattergeo
-@app.callback(
-    dash.dependencies.Output('playermap', 'figure'),
-    [dash.dependencies.Input('player-dropdown', 'value')]
-    )
-def update_figure(player):
-    # Set up lines
-    showlines = filters[player]
-    filtered_data = [p for i, p in enumerate(plot_data) if showlines[i]]
-    for datum in filtered_data:
-        datum['visible'] = True
+    # Update graph
+    return {
+        'data': filtered_data,
+        'layout': map_layout(player)
+    }
 
+def interaction_figure(player, filtered_data):
     # Set up layout
-    new_layout = dict(layout)
-    if player != 'All':
-        new_layout['title'] = '<b>2017 Tournament Matches for %s</b>' % player
+    new_layout = {
+        'yaxis':{
+            'dtick': 1,
+        },
+        'barmode': 'relative',
+        # 'paper_bgcolor':'rgb(240, 240, 240)',
+        # 'plot_bgcolor':'rgb(256, 256, 256)',
+        'title': '<b>Ranked Player Interactions for %s</b>' % player,
+        'showlegend': False,
+        'margin':dict(l=120),
+    }
 
     # Update graph
     return {
         'data': filtered_data,
-        'layout': new_layout
+        'layout': new_layout,
     }
 
-# Callback for the player interaction graph
-@app.callback(
-    dash.dependencies.Output('interaction', 'figure'),
-    [dash.dependencies.Input('player-dropdown', 'value')]
-    )
 def update_figure_2(player):
     # Collect only data for matching player name
     if player != 'All':
-        filtered_data = [interaction_data[i] for i,p in enumerate(interaction_names) if p == player][0]
-        # Set up layout
-        new_layout = {
-            'yaxis':{
-                'dtick': 1,
-            },
-            'barmode': 'relative',
-            # 'paper_bgcolor':'rgb(240, 240, 240)',
-            # 'plot_bgcolor':'rgb(256, 256, 256)',
-            'title': '<b>Ranked Player Interactions for %s</b>' % player,
-            'showlegend': False,
-            'margin':dict(l=120),
-        }
-
-        # Update graph
-        return {
-            'data': filtered_data,
-            'layout': new_layout,
-        }
+        filtered_data = interaction_data[interaction_index[player]]
+        return interaction_figure(player, filtered_data)
     else:
         # Return the default, no graph
         return {
@@ -420,6 +716,196 @@ def update_figure_2(player):
             'layout': interaction_layout
         }
 
+##### ON DEMAND FIGURES #####
+
+def aligned_data(tags):
+    # Map positions, region IDs and ranks by every ranking
+    # series aligned to the IDs of `tags`; only ranked players'
+    # lines are drawn
+    import numpy as np
+    lat = np.full(len(tags), np.nan)
+    lon = np.full(len(tags), np.nan)
+    for i, t in enumerate(tags):
+        if t in state['positions']:
+            lat[i], lon[i] = state['positions'][t]
+    return {
+        'lat': lat,
+        'lon': lon,
+        # region ID of each tag ID at every map level
+        'groups': {
+            level: np.array([
+                state['region_of'].get(t, {}).get(level, -1) for t in tags
+            ], dtype=np.int32)
+            for level in state['regions']
+        },
+        'ranks': {
+            series: np.array([ranked.get(t, 0) for t in tags], dtype=np.int32)
+            for series, ranked in rankings.items()
+        }
+    }
+
+season_data = None
+graph_data = None
+
+def load_season_data():
+    # The set store, with everything aligned to its tag IDs;
+    # loaded on the first season selection
+    global season_data
+    if season_data is None:
+        from set_store import SetStore
+        store = SetStore.load(SETS_FILE)
+        season_data = dict(aligned_data(store.tags), store=store)
+    return season_data
+
+def load_graph_data():
+    # The whole graph, for players without precomputed figures;
+    # loaded on the first selection of one
+    global graph_data
+    if graph_data is None:
+        from snapshot import load_data
+        graph = load_data()[2]
+        graph_data = dict(aligned_data(graph.tags), graph=graph)
+    return graph_data
+
+def season_figures(player, season, level='player', ranking=RANKING):
+    # Both figures from the graph of one season's sets
+    data = load_season_data()
+    return graph_figures(data, data['store'].season_graph(season), player,
+                         season, level, ranking)
+
+def graph_figures(data, graph, player, period, level='player', ranking=RANKING):
+    # Both figures from `graph`, drawn like the precomputed
+    # ones: regions or neutral lines between everyone for 'All',
+    # a player's wins green and losses red otherwise, players
+    # ordered by the `ranking` series
+    import numpy as np
+    lat, lon, ranks = data['lat'], data['lon'], data['ranks'][ranking]
+    on_map = (ranks > 0) & ~np.isnan(lat)
+
+    map_data = []
+    if player == 'All':
+        coo = graph.losses.tocoo()
+        keep = on_map[coo.row] & on_map[coo.col]
+        src, dst = coo.row[keep], coo.col[keep]
+        order = np.lexsort((dst, ranks[src]))
+        layers = [(src[order], dst[order], NEUTRAL_LINE)]
+        bars = [interaction_bars(graph, p, ranks) for p in top100]
+    else:
+        layers = []
+        q = graph.index.get(player)
+        if q is not None and not np.isnan(lat[q]):
+            for ids, color in [(graph.beat(player)[0], WIN_LINE),
+                               (graph.lost_to(player)[0], LOSS_LINE)]:
+                src = ids[on_map[ids]]
+                src = src[np.argsort(ranks[src], kind='stable')]
+                layers.append((src, np.full(len(src), q), color))
+        bars = interaction_bars(graph, player, ranks)
+
+    if player == 'All' and level in data['groups']:
+        layers = []
+        map_data = region_traces(graph.losses, data['groups'][level],
+                                 state['regions'][level])
+    for src, dst, color in layers:
+        if len(src):
+            map_data.append(merged_trace(src, dst, lat, lon, graph.tag_array, color))
+
+    map_figure = {'data': map_data, 'layout': map_layout(player, period)}
+    if player == 'All':
+        return map_figure, {'data': bars, 'layout': interaction_layout}
+    return map_figure, interaction_figure(player, bars)
+
+
+def searched_image(player):
+    # {player: picture url} for a player the preloaded store
+    # doesn't have a picture for, unchanged otherwise
+    if player in player_images or player not in images:
+        return dash.no_update
+    return {player: images[player]}
+
+
+# Both figures for the selected player, season and ranking,
+# answered in one request per dropdown change, with the
+# player's picture if the browser doesn't have it; only the
+# default ranking's figures are precomputed
+@app.callback(
+    [dash.dependencies.Output('playermap', 'figure'),
+     dash.dependencies.Output('interaction', 'figure'),
+     dash.dependencies.Output('searched-image', 'data')],
+    [dash.dependencies.Input('player-dropdown', 'value'),
+     dash.dependencies.Input('season-dropdown', 'value'),
+     dash.dependencies.Input('map-level', 'data'),
+     dash.dependencies.Input('ranking-dropdown', 'value')]
+)
+def update_selection(player, season, level, ranking=RANKING):
+    if player != 'All':
+        # players are always drawn line by line
+        level = 'player'
+    if ranking not in rankings:
+        ranking = RANKING
+    if season not in (None, 'All'):
+        figures = season_figures(player, season, level, ranking)
+    elif ranking != RANKING:
+        figures = graph_figures(load_graph_data(), load_graph_data()['graph'],
+                                player, '2017', level, ranking)
+    elif player in trace_index:
+        figures = update_figure(player, level), update_figure_2(player)
+    else:
+        figures = graph_figures(load_graph_data(), load_graph_data()['graph'],
+                                player, '2017')
+    return figures[0], figures[1], searched_image(player)
+
+
+# Number of players a search sends to the dropdown
+SEARCH_RESULTS = 20
+
+# Search every player as the user types, instead of sending
+# them all with the layout
+@app.callback(
+    dash.dependencies.Output('player-dropdown', 'options'),
+    [dash.dependencies.Input('player-dropdown', 'search_value')],
+    [dash.dependencies.State('player-dropdown', 'value')]
+)
+def update_options(search_value, value):
+    from player_search import dropdown_options, normalize
+    if not search_value:
+        raise dash.exceptions.PreventUpdate
+    options = dropdown_options(search, search_value, None if value == 'All' else value,
+                               SEARCH_RESULTS)
+    if value == 'All' or 'all'.startswith(normalize(search_value)):
+        options.insert(0, {'value': 'All', 'label': 'All'})
+    return options
+
+
+# Time every callback request; installed before the other
+# hooks so that the timing covers them too
+if METRICS:
+    metrics.instrument(app, 'dash_script', timing_header=TIMING_HEADER)
+
+# Encode callback outputs with the fast encoder and compress them;
+# installed before the cache so compression sees the responses last
+use_fast_encoder(app)
+compressed_responses = CompressedResponses()
+compressed_responses.install(app)
+
+# Serve repeat selections from already-serialized responses
+figure_cache = CallbackCache(
+    [o for o, c in app.callback_map.items() if 'callback' in c],
+    max_bytes=FIGURE_CACHE_BYTES
+)
+figure_cache.install(app)
+if WARM_FIGURE_CACHE:
+    figure_cache.warm(app, 'player-dropdown', list(trace_index),
+                      fixed=[('season-dropdown', 'All'),
+                             ('map-level', 'data', DEFAULT_LEVEL),
+                             ('ranking-dropdown', RANKING)])
+startup_timer.lap('dashboard')
+
+if METRICS:
+    metrics.set_timings('dash_preprocess_seconds', preprocess_timings, app='dash_script')
+    metrics.set_timings('dash_startup_seconds', startup_timer.timings, app='dash_script')
+    metrics.export_compression(compressed_responses, 'dash_script')
+    metrics.REGISTRY.add_cache(figure_cache.stats, app='dash_script', cache='figure')
+
 
 if __name__ == '__main__':
     app.run_server(debug=False, host="0.0.0.0")
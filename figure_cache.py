@@ -0,0 +1,138 @@
+"""
+LRU cache of serialized Dash callback responses, for
+callbacks whose output depends only on their inputs
+
+responses are stored as the exact bytes Dash sent the first
+time a selection was made, and served straight from a
+before_request hook on later requests for the same
+selection, so repeats skip the callback and serialization
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+import flask
+
+UPDATE_PATH = '_dash-update-component'
+
+
+def outputs_spec(output):
+    """the 'outputs' field of a request for callback `output`,
+    e.g. 'map.figure' or '..map.figure...img.src..' for a
+    multi-output callback
+    """
+    if output.startswith('..'):
+        return [outputs_spec(o) for o in output[2:-2].split('...')]
+    component_id, prop = output.rsplit('.', 1)
+    return {'id': component_id, 'property': prop}
+
+
+class CallbackCache(object):
+    """cache of `_dash-update-component` responses
+
+    input
+    ---------
+    outputs: callback outputs to cache, as Dash names them
+    in requests, e.g. 'playermap.figure'
+    max_bytes: memory cap; least recently used responses are
+    evicted past it
+    """
+
+    def __init__(self, outputs, max_bytes=64 * 1024 * 1024):
+        self.outputs = set(outputs)
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, body):
+        """cache key for a decoded callback request, or None
+        if its output isn't one of ours
+        """
+        if not body or body.get('output') not in self.outputs:
+            return None
+        values = [i.get('value') for i in body.get('inputs', [])] + \
+                 [s.get('value') for s in body.get('state', [])]
+        return body['output'] + json.dumps(values, sort_keys=True)
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= len(self.entries.pop(key))
+            self.entries[key] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                _, old = self.entries.popitem(last=False)
+                self.bytes -= len(old)
+
+    def install(self, app):
+        """serve cached responses for `app`'s callbacks and
+        cache the responses to ones not seen yet
+        """
+        server = app.server
+
+        @server.before_request
+        def serve_cached_callback():
+            if not flask.request.path.endswith(UPDATE_PATH):
+                return None
+            key = self.key(flask.request.get_json(silent=True))
+            if key is None:
+                return None
+            data = self.get(key)
+            if data is None:
+                flask.g.callback_cache_key = key
+                return None
+            return flask.Response(data, mimetype='application/json')
+
+        @server.after_request
+        def store_callback_response(response):
+            key = flask.g.pop('callback_cache_key', None)
+            if key is not None and response.status_code == 200:
+                self.put(key, response.get_data())
+            return response
+
+    def warm(self, app, input_id, values, prop='value', fixed=()):
+        """fill the cache ahead of time by requesting every
+        cached output that depends on a single input for each
+        of its `values`; `fixed` lists (id, value) of the callbacks' other inputs,
+        or (id, property, value) for ones other than `prop`, in
+        the order they're declared
+        """
+        fixed = [f if len(f) == 3 else (f[0], prop, f[1]) for f in fixed]
+        client = app.server.test_client()
+        for output in sorted(self.outputs):
+            inputs = app.callback_map[output]['inputs']
+            if {'id': input_id, 'property': prop} not in inputs:
+                continue
+            for value in values:
+                client.post('/' + UPDATE_PATH, json={
+                    'output': output,
+                    'outputs': outputs_spec(output),
+                    'inputs': [
+                        {'id': input_id, 'property': prop, 'value': value}
+                    ] + [
+                        {'id': i, 'property': p, 'value': v} for i, p, v in fixed
+                    ],
+                    'changedPropIds': ['%s.%s' % (input_id, prop)]
+                })
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.entries),
+            'bytes': self.bytes
+        }
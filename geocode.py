@@ -0,0 +1,204 @@
+"""
+batch geocoding of player locations, for the players that
+get_sgg_players() returns without coordinates
+
+players are grouped by location (city/state and country, as
+one query string), so every location is resolved once no
+matter how many players share it; resolutions are kept in a
+persistent json cache, failed ones included, and only
+queries the cache hasn't seen go to the backend
+
+a backend is any callable that takes a list of query strings
+and returns {query: [lat, lon] or None}; Gazetteer resolves
+them offline from a file like data/citystates.json
+"""
+
+import json
+import os
+
+import metrics
+
+CITYSTATES_PATH = 'data/citystates.json'
+CACHE_PATH = 'data/geocode_cache.json'
+
+
+def normalize(query):
+    """casefold and collapse whitespace, so that 'Chicago,IL'
+    and 'chicago, IL ' are the same place
+    """
+    parts = [' '.join(p.split()) for p in query.casefold().split(',')]
+    return ', '.join(p for p in parts if p)
+
+
+def location_query(player):
+    """query string of a player's location, e.g. 'Chicago, IL,
+    United States', from their citystate (or state, which is
+    all get_sgg_players() has) and country; None if neither
+    """
+    place = player.get('citystate') or player.get('state')
+    parts = [p.strip() for p in (place, player.get('country')) if p and p.strip()]
+    return ', '.join(parts) or None
+
+
+class Gazetteer(object):
+    """offline backend resolving queries from a json file of
+    {place: [lat, lon]}; a query not in the file falls back to
+    its coarser suffixes, e.g. 'Weare, NH, United States' to
+    'NH, United States' and then 'United States'
+
+    input
+    ---------
+    path (optional): gazetteer json file
+    places (optional): {place: [lat, lon]} to use instead
+    fallback (optional): try coarser suffixes of unknown queries
+    """
+
+    def __init__(self, path=CITYSTATES_PATH, places=None, fallback=True):
+        if places is None:
+            with open(path) as file:
+                places = json.load(file)
+        self.places = {normalize(k): v for k, v in places.items()}
+        self.fallback = fallback
+
+    def resolve(self, query):
+        key = normalize(query)
+        while key:
+            if key in self.places:
+                return self.places[key]
+            if not self.fallback:
+                return None
+            key = key.partition(', ')[2]
+        return None
+
+    def __call__(self, queries):
+        return {q: self.resolve(q) for q in queries}
+
+
+class LocationCache(object):
+    """persistent {normalized query: [lat, lon] or None}
+
+    input
+    ---------
+    path: json file to keep resolutions in; read if it exists
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.resolutions = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as file:
+                self.resolutions = json.load(file)
+        self.dirty = False
+
+    def __contains__(self, query):
+        return normalize(query) in self.resolutions
+
+    def __len__(self):
+        return len(self.resolutions)
+
+    def get(self, query):
+        return self.resolutions.get(normalize(query))
+
+    def update(self, resolved):
+        """store {query: [lat, lon] or None}"""
+        for query, latlon in resolved.items():
+            self.resolutions[normalize(query)] = latlon
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty or self.path is None:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as file:
+            json.dump(self.resolutions, file, sort_keys=True)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'locations': len(self.resolutions)}
+
+
+class Geocoder(object):
+    """resolve player locations through `backend`, looking up
+    only the distinct locations `cache` hasn't seen
+
+    input
+    ---------
+    backend: callable of [query] -> {query: [lat, lon] or None}
+    cache (optional): LocationCache; saved after every batch,
+    so an interrupted run keeps what it resolved
+    batch_size (optional): queries per backend call
+    retry_failed (optional): send queries cached as unresolved
+    to the backend again
+    """
+
+    def __init__(self, backend, cache=None, batch_size=100, retry_failed=False):
+        self.backend = backend
+        self.cache = cache if cache is not None else LocationCache(None)
+        self.batch_size = batch_size
+        self.retry_failed = retry_failed
+
+    def resolve(self, queries):
+        """{query: [lat, lon] or None} for distinct `queries`"""
+        unseen = [q for q in queries if q not in self.cache or
+                  (self.retry_failed and self.cache.get(q) is None)]
+        hits = len(queries) - len(unseen)
+        self.cache.hits += hits
+        self.cache.misses += len(unseen)
+        metrics.REGISTRY.inc('cache_requests_total', hits, cache='geocode', result='hit')
+        metrics.REGISTRY.inc('cache_requests_total', len(unseen),
+                             cache='geocode', result='miss')
+
+        for i in range(0, len(unseen), self.batch_size):
+            batch = unseen[i:i + self.batch_size]
+            resolved = self.backend(batch)
+            self.cache.update({q: resolved.get(q) for q in batch})
+            self.cache.save()
+        return {q: self.cache.get(q) for q in queries}
+
+    def geocode(self, players, overwrite=False):
+        """set 'latlon' of every player whose location resolves,
+        in place
+
+        input
+        ---------
+        players: {key: player info}, e.g. as output by
+        get_sgg_players(), or an iterable of player infos
+        overwrite (optional): also redo players that already
+        have a 'latlon'
+
+        output
+        ---------
+        stats: counts of players and distinct locations handled,
+        of those found in the cache and of those resolved
+        """
+        if isinstance(players, dict):
+            players = players.values()
+        by_query = {}
+        for p in players:
+            if not overwrite and p.get('latlon') is not None:
+                continue
+            query = location_query(p)
+            if query is not None:
+                by_query.setdefault(normalize(query), []).append(p)
+
+        cached = sum(q in self.cache for q in by_query)
+        resolved = self.resolve(list(by_query))
+        n_players = 0
+        for query, latlon in resolved.items():
+            if latlon is None:
+                continue
+            for p in by_query[query]:
+                p['latlon'] = list(latlon)
+                n_players += 1
+
+        return {
+            'players': sum(len(ps) for ps in by_query.values()),
+            'locations': len(by_query),
+            'cached': cached,
+            'resolved': sum(v is not None for v in resolved.values()),
+            'players_resolved': n_players
+        }
@@ -0,0 +1,164 @@
+"""
+incremental loss graph building: keep a ledger of the
+sets and phase groups already counted next to the graph,
+so new tournaments can be added to a checkpoint without
+a full rebuild and without double counting
+
+the ledger is append-only json lines, one per save() with the
+set and phase group IDs counted since the one before, so a
+checkpoint writes only what's new to it (the graph itself is
+still rewritten whole); each line holds a digest of the graph
+it was written with, and is written before the graph is
+replaced, so a line left by a save that didn't finish is
+dropped on load
+"""
+
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+from smashgg_constructor import add_to_graph, phase_group_complete
+
+
+def ledger_path(graph_path):
+    """path of the ledger kept alongside a graph json file"""
+    return graph_path + '.ledger'
+
+
+class GraphLedger(object):
+    """loss graph plus the IDs of everything counted in it
+
+    input
+    ---------
+    graph (optional): {losing player: {winning player: n wins}},
+    players as per smashgg_constructor.player_key()
+    sets (optional): iterable of set IDs already in `graph`
+    phase_groups (optional): iterable of completed phase group
+    IDs whose sets are all in `graph`; groups without sets are
+    never recorded, since they may not have been played yet
+    """
+
+    def __init__(self, graph=None, sets=(), phase_groups=()):
+        self.graph = defaultdict(lambda: defaultdict(int))
+        for loser, wins in (graph or {}).items():
+            self.graph[loser].update(wins)
+        self.sets = set(str(s) for s in sets)
+        self.phase_groups = set(str(pg) for pg in phase_groups)
+        # graph path whose ledger holds everything but the IDs
+        # below, which the next save() there appends
+        self.saved_to = None
+        self.new_sets = set()
+        self.new_phase_groups = set()
+
+    def add_phases(self, phases, players):
+        """count the sets of `phases` that aren't in the graph yet
+
+        input
+        ---------
+        phases: list of phase group json objects,
+        as per get_sgg_phases()
+        players: as per get_sgg_players()
+
+        output
+        ---------
+        n_new: number of phase groups that had to be walked
+        """
+        new = [
+            p for p in phases
+            if str(p['entities']['groups']['id']) not in self.phase_groups
+        ]
+        # the decided sets add_to_graph() is about to record
+        self.new_sets.update(
+            str(s['id']) for p in new for s in p['entities']['sets']
+            if s['winnerId'] is not None and str(s['id']) not in self.sets
+        )
+        add_to_graph(new, players, graph=self.graph, seen_sets=self.sets)
+
+        # finished phase groups can be skipped wholesale next
+        # time; empty or unstarted ones are walked again
+        for p in new:
+            if phase_group_complete(p):
+                pg = str(p['entities']['groups']['id'])
+                self.phase_groups.add(pg)
+                self.new_phase_groups.add(pg)
+
+        return len(new)
+
+    def save(self, graph_path):
+        """write the graph in the same format as
+        data/2017_lossgraph.json, and append what's new to its
+        ledger (or write the ledger whole, if this ledger wasn't
+        loaded from or last saved to `graph_path`); a graph of
+        integer IDs is noted in the ledger, since json turns
+        them into strings
+        """
+        data = json.dumps(self.graph).encode('utf-8')
+        appending = _same_path(self.saved_to, graph_path)
+        entry = {
+            'sets': sorted(self.new_sets if appending else self.sets),
+            'phase_groups': sorted(
+                self.new_phase_groups if appending else self.phase_groups
+            ),
+            'ids': any(isinstance(p, int) for p in self.graph),
+            'graph': hashlib.sha256(data).hexdigest()
+        }
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+        if appending:
+            with open(ledger_path(graph_path), 'ab') as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+        else:
+            _write_atomic(line, ledger_path(graph_path))
+        _write_atomic(data, graph_path)
+        self.saved_to = graph_path
+        self.new_sets = set()
+        self.new_phase_groups = set()
+
+    @classmethod
+    def load(cls, graph_path):
+        """resume from a checkpoint written by save(); a graph
+        without a ledger is loaded with an empty ledger
+        """
+        with open(graph_path, 'rb') as file:
+            data = file.read()
+        graph = json.loads(data.decode('utf-8'))
+        text = ''
+        if os.path.exists(ledger_path(graph_path)):
+            with open(ledger_path(graph_path)) as file:
+                text = file.read()
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+        # ledgers from before it was appended to are a single
+        # line without a newline or digest; rewrite those, and
+        # drop the line of a save() that appended it but didn't
+        # get to replace the graph
+        rewrite = bool(text) and not text.endswith('\n')
+        if entries and entries[-1].get('graph', None) not in (
+                None, hashlib.sha256(data).hexdigest()):
+            entries.pop()
+            rewrite = True
+        if rewrite:
+            _write_atomic(''.join(json.dumps(e) + '\n' for e in entries).encode('utf-8'),
+                          ledger_path(graph_path))
+        if any(e.get('ids') for e in entries):
+            graph = {
+                int(loser): {int(w): n for w, n in wins.items()}
+                for loser, wins in graph.items()
+            }
+        ledger = cls(graph,
+                     [s for e in entries for s in e['sets']],
+                     [pg for e in entries for pg in e['phase_groups']])
+        ledger.saved_to = graph_path
+        return ledger
+
+
+def _same_path(a, b):
+    return a is not None and os.path.abspath(a) == os.path.abspath(b)
+
+
+def _write_atomic(data, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as file:
+        file.write(data)
+    os.replace(tmp, path)
@@ -1,5 +1,7 @@
 ##### IMPORTS #####
+import functools
 import json
+import os
 import numpy as np
 import pandas as pd
 import plotly
@@ -8,36 +10,97 @@ import dash_core_components as dcc
 import dash_html_components as html
 import pandas as pd
 import plotly.graph_objs as go
+import metrics
+import ratings
+from pair_query import PairQuery
+from player_search import PlayerSearch, dropdown_options
+from prep_cache import PhaseTimer
+from set_store import SETS_PATH, SetStore
+from response_pipeline import CompressedResponses, use_fast_encoder
+from snapshot import load_data
 
 ##### DATA LOADING #####
 
-with open('data/players.json') as file:
-    players = json.load(file)
-with open('data/citystates.json') as file:
-    cs_geo = json.load(file)
-with open('data/2017_lossgraph.json') as file:
-    lossgraph = json.load(file)
-with open('data/2017_wingraph.json') as file:
-    wingraph = json.load(file)
+# Seconds each phase of this worker's startup takes
+startup_timer = PhaseTimer()
+
+# Ranking series players are ordered and filtered by: the
+# SSBMRank from smash.gg, or one of ratings.METHODS computed
+# from the results ('Elo' and 'Glicko' need the set store);
+# the ranking dropdown offers the others too
+RANKING = 'SSBMRank'
+# Number of players a computed ranking ranks
+RATED_PLAYERS = 100
+
+# Read from the compiled snapshot (python snapshot.py build) if
+# there is an up to date one, otherwise from the json files;
+# the win graph is the transpose of the loss graph
+players, cs_geo, graph = load_data()
+startup_timer.lap('load')
 
 ##### UDFs #####
 
 def get_ranking(player_name, player_info):
     #Find any ranked player's ranking, return zero for unranked
-    ranking = player_info[player_name]['rankings'].get('SSBMRank', 0)
+    ranking = player_info[player_name]['rankings'].get(RANKING, 0)
 
     return ranking
 
-def find_2way_interactions(player_name, wins=wingraph, losses=lossgraph):
-    # Only returns interactions for which both players have won
-    # and lost to one another
-    interaction_set = set([k for k,v in wins[player_name].items()]) | \
-                        set([k for k,v in losses[player_name].items()])
+def find_2way_interactions(player_name, graph=graph):
+    # Returns sorted graph IDs of everyone the player
+    # has either won or lost against
+    return graph.opponents(player_name)
 
-    return interaction_set
+def bar_traces(names, win_heights, loss_heights, xaxis, yaxis):
+    # Horizontal win and loss bars against the named opponents
+    wins = {
+        'y': names,
+        'x': win_heights,
+        'name': 'wins',
+        'type': 'bar',
+        'width': 0.8,
+        'orientation': 'h',
+        'marker':{
+            'color': 'rgba(68, 200, 68, 0.8)'
+        },
+        'xaxis': xaxis,
+        'yaxis': yaxis
+    }
+    losses = {
+        'y': names,
+        'x': [-x for x in loss_heights],
+        'width': 0.8,
+        'name': 'losses',
+        'type': 'bar',
+        'orientation': 'h',
+        'marker':{
+            'color': 'rgba(200, 68, 68, 0.8)'
+        },
+        'xaxis': xaxis,
+        'yaxis': yaxis
+    }
+    return [wins, losses]
 
 ##### PREPROCESSING #####
 
+# Sets by date, when there's a store of them: the season
+# dropdown then shows any year or half year in it
+season_store = SetStore.load(SETS_PATH) if os.path.exists(SETS_PATH) else None
+seasons = season_store.seasons() if season_store is not None else []
+
+# Rank the players by their results too, by every method
+# there's data for; the series the ranking dropdown offers
+rankings = [RANKING]
+for method in ratings.METHODS:
+    if method != 'PageRank' and season_store is None:
+        continue
+    ratings.add_rankings(
+        players, ratings.scores(method, graph, season_store),
+        method, RATED_PLAYERS
+    )
+    if method not in rankings:
+        rankings.append(method)
+
 # Add jitter to each player's lat lon coordinates
 for p in players:
     isnorcal = issocal = False
@@ -57,8 +120,8 @@ playerDF2 = pd.DataFrame(
 )
 
 top100 = sorted(
-    [p for p in players if players[p]['rankings'].get('SSBMRank') is not None],
-    key=lambda x: players[x]['rankings']['SSBMRank']
+    [p for p in players if players[p]['rankings'].get(RANKING) is not None],
+    key=lambda x: players[x]['rankings'][RANKING]
 )
 
 for i, p in enumerate(top100):
@@ -71,60 +134,99 @@ for i, p in enumerate(top100):
         )
 playerDF2.reset_index(drop=True, inplace=True)
 
-# Lines
-interaction_data = list()
-interaction_names = list()
-interaction_layout = dict()
-
-for p in top100:
-    # Add interaction plot data
-    wins, losses = (wingraph[p], lossgraph[p])
-    names = set([name for name in wins.keys()]) | set([name for name in losses.keys()])
-
-    interactions = dict()
-    for name in names:
-        ranking = get_ranking(name, players)
-        if ranking > 0:
-            interactions[name] = (wins.get(name, 0), losses.get(name, 0), ranking)
+# Ranked opponent records of any player in the graph: the
+# ranked players' built now, anyone else's when first compared
+ranks = graph.rankings(players, RANKING)
+pair_query = PairQuery(graph, ranks, top100)
 
-    sorted_interactions = sorted(list(interactions.items()), key=lambda x: x[1][2], reverse=True)
 
-    names = [x[0] for x in sorted_interactions]
-    win_heights = [x[1][0] for x in sorted_interactions]
-    loss_heights = [-x[1][1] for x in sorted_interactions]
-
-    wins = {
-        'y': names,
-        'x': win_heights,
-        'name': 'wins',
-        'type': 'bar',
-        'width': 0.8,
-        'orientation': 'h',
-        'marker':{
-            'color': 'rgba(68, 200, 68, 0.8)'
-        }
-    };
-    losses = {
-        'y': names,
-        'x': loss_heights,
-        'width': 0.8,
-        'name': 'losses',
-        'type': 'bar',
-        'orientation': 'h',
-        'marker':{
-            'color': 'rgba(200, 68, 68, 0.8)'
-        }
-    };
+@functools.lru_cache(maxsize=None)
+def season_pair_query(season, ranking=RANKING):
+    # Opponent records ranked by one series, within one season
+    # or the default graph, built on first use
+    season_graph = graph if season in (None, 'All') else season_store.season_graph(season)
+    return PairQuery(
+        season_graph, season_graph.rankings(players, ranking),
+        [p for p in top100 if p in season_graph]
+    )
 
-    interaction_data.append([wins, losses]);
-    interaction_names.append(p)
 
-## End of player loop ##
+def query_for(season, ranking=RANKING):
+    if season in (None, 'All') and ranking == RANKING:
+        return pair_query
+    return season_pair_query(season, ranking)
 
 
 # Initialize the figures for the plots
 sfig = plotly.tools.make_subplots(rows=1, cols=2, print_grid=False)
 
+# Side by side layout shared by every pair figure, built once
+pair_layout = plotly.tools.make_subplots(
+    rows=1, cols=2, print_grid=False
+).layout.to_plotly_json()
+for key, value in {
+        'barmode':'relative',
+        'showlegend':False,
+        'title':{'text':'Record Comparison'},
+        'hoverlabel':dict(
+            bgcolor='black',
+            font={'color': 'white'}
+        ),
+        'margin':{
+            'l':130,
+            'r':130
+        }}.items():
+    pair_layout[key] = value
+pair_layout['yaxis'] = dict(pair_layout['yaxis'], dtick=1)
+pair_layout['yaxis2'] = dict(pair_layout['yaxis2'], dtick=1, side='right')
+
+# Number of assembled pair figures to keep
+PAIR_CACHE_SIZE = 1024
+
+# Search index over everyone with sets, ranked players first
+# and then the rest by sets played, and the number of matches
+# a search sends to a dropdown
+played = np.asarray(graph.losses.sum(axis=0) + graph.losses.sum(axis=1).T).ravel()
+search = PlayerSearch(
+    graph.tags,
+    [players[t]['name'] if t in players else None for t in graph.tags],
+    np.where(ranks > 0, ranks, ranks.max(initial=0) + 1 + played.max(initial=0) - played)
+)
+SEARCH_RESULTS = 20
+
+# Picture url for each dropdown entry that has one, and the
+# dropdown entries' records against each other, packed row major
+# for each season: wins[i * n + j] is how many sets top100[i]
+# won against top100[j]
+player_images = {
+    p: players[p]['image']['url'] for p in top100
+    if players[p]['image'] is not None
+}
+
+def top_wins(graph):
+    # zeros for anyone not in `graph`
+    ids = np.array([graph.index.get(p, -1) for p in top100])
+    found = ids >= 0
+    wins = np.zeros((len(top100), len(top100)), dtype=np.int64)
+    wins[np.ix_(found, found)] = graph.wins[ids[found]][:, ids[found]].toarray()
+    return wins.ravel().tolist()
+
+h2h_table = {
+    'index': {p: i for i, p in enumerate(top100)},
+    'n': len(top100),
+    # 'All' is the default graph
+    'wins': dict(
+        [('All', top_wins(graph))] +
+        [(s, top_wins(season_store.season_graph(s))) for s in seasons]
+    )
+}
+startup_timer.lap('preprocess')
+
+# Whether to serve timings, payload sizes and cache hit rates
+# on /metrics, and to add a Server-Timing header to responses
+METRICS = True
+TIMING_HEADER = False
+
 ##### DASHBOARD #####
 
 app = dash.Dash()
@@ -173,9 +275,31 @@ app.layout = html.Div(
             html.Div([
                 html.H2([
                     html.Br(), html.Br(),
-                    html.B('2017 Head to Head:'),
+                    html.B('2017 Head to Head:', id='h2h-title'),
                     html.Br(),
-                    html.P('', id='h2h')])
+                    html.P('', id='h2h')]),
+                html.Div([
+                    dcc.Dropdown(
+                        id='season-dropdown',
+                        options=
+                            [{'value': 'All', 'label': '2017 (default)'}] +
+                            [{'value': s, 'label': s} for s in seasons],
+                        value='All',
+                        clearable=False
+                    )],
+                    # only when there are seasons to pick
+                    style={'display': 'block' if seasons else 'none'}
+                ),
+                html.Div([
+                    dcc.Dropdown(
+                        id='ranking-dropdown',
+                        options=[{'value': r, 'label': r} for r in rankings],
+                        value=RANKING,
+                        clearable=False
+                    )],
+                    # only when there's more than one ranking
+                    style={'display': 'block' if len(rankings) > 1 else 'none'}
+                )
             ], style={
                 'width':'29%',
                 'display':'inline-block',
@@ -237,164 +361,158 @@ app.layout = html.Div(
         ),
         style={'width': '100%'},
         id='output'
-    )],
+    ),
+     # Static lookups for the client side callbacks, sent once
+     dcc.Store(id='player-images', data=player_images),
+     dcc.Store(id='h2h-table', data=h2h_table),
+     # Record and pictures of pairs the stores don't cover,
+     # sent along with the figure
+     dcc.Store(id='pair-record')],
     style={'background-color': 'rgba(29, 128, 159, 0.9)'}
 )
 
-# h2h callback
-@app.callback(
+def update_h2h(p1, p2, season='All'):
+    # Record in the default graph or one season's, 0 - 0 for
+    # anyone who didn't play in it
+    query = query_for(season)
+    if p1 in query and p2 in query:
+        return '%d - %d' % query.record(p1, p2)
+    return '0 - 0'
+
+
+# Record and pictures of ranked players are looked up in the
+# browser from the preloaded stores; anyone else's come with
+# the figure, in pair-record
+app.clientside_callback(
+    """
+    function(p1, p2, season, record, table) {
+        var i = table.index[p1], j = table.index[p2], wins = table.wins[season];
+        if (i !== undefined && j !== undefined) {
+            return wins[i * table.n + j] + ' - ' + wins[j * table.n + i];
+        }
+        if (record && record.p1 === p1 && record.p2 === p2 && record.season === season) {
+            return record.h2h;
+        }
+        return '';
+    }
+    """,
     dash.dependencies.Output('h2h', 'children'),
     [dash.dependencies.Input('p1-dropdown', 'value'),
-     dash.dependencies.Input('p2-dropdown', 'value')]
+     dash.dependencies.Input('p2-dropdown', 'value'),
+     dash.dependencies.Input('season-dropdown', 'value'),
+     dash.dependencies.Input('pair-record', 'data')],
+    [dash.dependencies.State('h2h-table', 'data')]
 )
-def update_h2h(p1, p2):
-    return ' - '.join(
-        [str(wingraph[p1][p2]) if p2 in wingraph[p1] else '0',
-         str(wingraph[p2][p1]) if p1 in wingraph[p2] else '0']
-    )
-
 
-# callback for image visibility
-@app.callback(
-    dash.dependencies.Output('p2-img', 'style'),
-    [dash.dependencies.Input('p2-dropdown', 'value')]
-)
-def inset_image2(player):
-    if players[player]['image'] is None:
-        return {'visibility':'hidden'}
-    else:
-        return {'visibility':'visible'}
 
+def pair_record(p1, p2, season):
+    # Record and pictures for pair-record, only needed when a
+    # player isn't in the preloaded stores
+    if p1 in h2h_table['index'] and p2 in h2h_table['index']:
+        return dash.no_update
+    return {
+        'p1': p1, 'p2': p2, 'season': season,
+        'h2h': update_h2h(p1, p2, season),
+        'images': {
+            p: players[p]['image']['url'] for p in (p1, p2)
+            if p in players and players[p].get('image') is not None
+        }
+    }
 
-# callback for image url
-@app.callback(
-    dash.dependencies.Output('p2-img', 'src'),
-    [dash.dependencies.Input('p2-dropdown', 'value')]
+app.clientside_callback(
+    """
+    function(season) {
+        return (season === 'All' ? '2017' : season) + ' Head to Head:';
+    }
+    """,
+    dash.dependencies.Output('h2h-title', 'children'),
+    [dash.dependencies.Input('season-dropdown', 'value')]
 )
-def inset_image2(player):
-    return players[player]['image'].get('url')
-
 
-# callback for image visibility
-@app.callback(
-    dash.dependencies.Output('p1-img', 'style'),
-    [dash.dependencies.Input('p1-dropdown', 'value')]
-)
-def inset_image(player):
-    if players[player]['image'] is None:
-        return {'visibility':'hidden'}
-    else:
-        return {'visibility':'visible'}
+for side in ('p1', 'p2'):
+    app.clientside_callback(
+        """
+        function(player, record, images) {
+            var url = images[player] || (record && record.images[player]);
+            if (!url) {
+                return [null, {'visibility': 'hidden'}];
+            }
+            return [url, {'visibility': 'visible'}];
+        }
+        """,
+        [dash.dependencies.Output(side + '-img', 'src'),
+         dash.dependencies.Output(side + '-img', 'style')],
+        [dash.dependencies.Input(side + '-dropdown', 'value'),
+         dash.dependencies.Input('pair-record', 'data')],
+        [dash.dependencies.State('player-images', 'data')]
+    )
 
 
-# callback for image url
-@app.callback(
-    dash.dependencies.Output('p1-img', 'src'),
-    [dash.dependencies.Input('p1-dropdown', 'value')]
-)
-def inset_image(player):
-    return players[player]['image'].get('url')
+# Search the players as the user types, instead of sending
+# them all with the layout
+for side in ('p1', 'p2'):
+    @app.callback(
+        dash.dependencies.Output(side + '-dropdown', 'options'),
+        [dash.dependencies.Input(side + '-dropdown', 'search_value')],
+        [dash.dependencies.State(side + '-dropdown', 'value')]
+    )
+    def update_options(search_value, value):
+        if not search_value:
+            raise dash.exceptions.PreventUpdate
+        return dropdown_options(search, search_value, value, SEARCH_RESULTS)
 
 
-# Callback for the player interaction graph
+# Callback for the player interaction graph, plus the record
+# of pairs the browser can't look up itself, so that no pair
+# needs a second request
 @app.callback(
-    dash.dependencies.Output('interaction', 'figure'),
+    [dash.dependencies.Output('interaction', 'figure'),
+     dash.dependencies.Output('pair-record', 'data')],
     [dash.dependencies.Input('p1-dropdown', 'value'),
-     dash.dependencies.Input('p2-dropdown', 'value')]
+     dash.dependencies.Input('p2-dropdown', 'value'),
+     dash.dependencies.Input('season-dropdown', 'value'),
+     dash.dependencies.Input('ranking-dropdown', 'value')]
     )
-def update_figure(player1, player2):
-    cross_int = [
-        p for p in find_2way_interactions(player1) & \
-            find_2way_interactions(player2)
-        if p in top100
-    ]
-
-    # Collect only data for matching player name
-    p1_data = [
-        i.copy() for i in
-        interaction_data[interaction_names.index(player1)]
-    ]
-
-    p1_xwin = []
-    p1_xloss = []
-    p1_y = []
-
-    for xw, xl, y in zip(p1_data[0]['x'], p1_data[1]['x'], p1_data[0]['y']):
-        if y in cross_int:
-            p1_xwin.append(xw)
-            p1_xloss.append(xl)
-            p1_y.append(y)
-
-    p1_data[0]['x'], p1_data[1]['x'],\
-        p1_data[0]['y'], p1_data[1]['y'] = p1_xwin, p1_xloss, p1_y, p1_y
-
-    p2_data = [
-        i.copy() for i in
-        interaction_data[interaction_names.index(player2)]
-    ]
-
-    p2_xwin = []
-    p2_xloss = []
-    p2_y = []
-
-    for xw, xl, y in zip(p2_data[0]['x'], p2_data[1]['x'], p2_data[0]['y']):
-        if y in cross_int:
-            p2_xwin.append(xw)
-            p2_xloss.append(xl)
-            p2_y.append(y)
-
-    p2_data[0]['x'], p2_data[1]['x'], \
-        p2_data[0]['y'], p2_data[1]['y'] = p2_xwin, p2_xloss, p2_y, p2_y
-
-    # Set up layout
-    new_layout = {
-      'barmode': 'relative',
-      'autosize': True,
-      'width':1000,
-      'paper_bgcolor':'rgb(240, 240, 240)',
-      'plot_bgcolor':'rgb(256, 256, 256)',
-      'title': '<b>Ranked Player Interactions for %s and %s</b>' % (player1, player2),
-      'showlegend': False,
-      'margin':dict(l=120),
-    }
+def update_figure(player1, player2, season, ranking=RANKING):
+    if ranking not in rankings:
+        ranking = RANKING
+    return (pair_figure(player1, player2, season, ranking),
+            pair_record(player1, player2, season))
+
+
+@functools.lru_cache(maxsize=PAIR_CACHE_SIZE)
+def pair_figure(player1, player2, season='All', ranking=RANKING):
+    # Each player's records against the players ranked in the
+    # `ranking` series both have played, in the default graph
+    # or one season's
+    query = query_for(season, ranking)
+    if player1 in query and player2 in query:
+        p1_bars, p2_bars = query.pair(player1, player2)
+    else:
+        p1_bars = p2_bars = ([], [], [])
 
-    sfig = plotly.tools.make_subplots(rows=1, cols=2, print_grid=False)
-    sfig.append_trace(
-        p1_data[0], 1, 1
-    )
-    sfig.append_trace(
-        p1_data[1], 1, 1
-    )
-    sfig.append_trace(
-        p2_data[0], 1, 2
-    )
-    sfig.append_trace(
-        p2_data[1], 1, 2
-    )
-    sfig.layout.update(
-        {'barmode':'relative',
-         'showlegend':False,
-         'title':'Record Comparison',
-         'hoverlabel':dict(
-             bgcolor='black',
-             font={'color': 'white'}
-         ),
-         'margin':{
-             'l':130,
-             'r':130
-         },
-         'yaxis':{
-             'dtick':1
-         },
-         'yaxis2':{
-             'dtick':1,
-             'side':'right'
-         }
-        }
-    )
+    return {
+        'data': bar_traces(*p1_bars, 'x', 'y') + bar_traces(*p2_bars, 'x2', 'y2'),
+        'layout': pair_layout
+    }
 
-    # Update graph
-    return sfig
+# Time every callback request; installed before the other
+# hooks so that the timing covers them too
+if METRICS:
+    metrics.instrument(app, 'head_to_head', timing_header=TIMING_HEADER)
+
+# Encode callback outputs with the fast encoder and compress them
+use_fast_encoder(app)
+compressed_responses = CompressedResponses()
+compressed_responses.install(app)
+startup_timer.lap('dashboard')
+
+if METRICS:
+    metrics.set_timings('dash_startup_seconds', startup_timer.timings, app='head_to_head')
+    metrics.export_compression(compressed_responses, 'head_to_head')
+    metrics.REGISTRY.add_cache(lambda: pair_figure.cache_info()._asdict(),
+                               app='head_to_head', cache='pair_figure')
+    metrics.REGISTRY.add_cache(pair_query.stats, app='head_to_head', cache='pair_rows')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,117 @@
+"""
+levels of detail for the match map: players grouped into
+regions (their country, their state or region, or a cell of a
+lat/lon grid) and every set between two regions summed into a
+single weighted edge, so the map's size depends on how many
+regions there are rather than on how many players
+"""
+
+import numpy as np
+from scipy import sparse
+
+# coarsest first
+LEVELS = ['country', 'state', 'grid']
+# degrees of latitude and longitude per grid cell
+GRID_DEGREES = 2.0
+
+
+def region_name(info, level, grid=GRID_DEGREES):
+    """name of the region a player (their players.json entry)
+    is in at `level`, or None if they have no coordinates
+    """
+    latlon = info.get('latlon')
+    if latlon is None:
+        return None
+    country = info.get('country') or '?'
+    if level == 'country':
+        return country
+    if level == 'state':
+        # regions (e.g. NorCal) split states where they're set
+        place = info.get('region') or info.get('state')
+        return '%s, %s' % (place, country) if place else country
+    if level == 'grid':
+        return '%.0f, %.0f' % (
+            (np.floor(latlon[0] / grid) + 0.5) * grid,
+            (np.floor(latlon[1] / grid) + 0.5) * grid
+        )
+    raise ValueError('unknown map level %r' % level)
+
+
+def group_players(tags, players, level, grid=GRID_DEGREES):
+    """group players into the regions of `level`
+
+    input
+    ---------
+    tags: player tags, e.g. a MatchGraph's tags
+    players: {tag: info}, as in data/players.json
+    level: one of LEVELS
+
+    output
+    ---------
+    groups: array of each tag's region ID, -1 if unmapped
+    labels: list of region names, by region ID
+    lat, lon: arrays of each region's mean player position
+    sizes: array of each region's number of players
+    """
+    index = {}
+    groups = np.full(len(tags), -1, dtype=np.int32)
+    latlon = np.zeros((len(tags), 2))
+    for i, t in enumerate(tags):
+        info = players.get(t)
+        name = region_name(info, level, grid) if info is not None else None
+        if name is None:
+            continue
+        groups[i] = index.setdefault(name, len(index))
+        latlon[i] = info['latlon']
+
+    mapped = groups >= 0
+    sizes = np.bincount(groups[mapped], minlength=len(index))
+    lat = np.bincount(groups[mapped], latlon[mapped, 0], len(index))
+    lon = np.bincount(groups[mapped], latlon[mapped, 1], len(index))
+    return (groups, list(index), lat / np.maximum(sizes, 1),
+            lon / np.maximum(sizes, 1), sizes)
+
+
+def region_edges(losses, groups, n_groups, max_edges=None):
+    """sets between and within regions
+
+    input
+    ---------
+    losses: sparse matrix of losses[i, j] sets i lost to j,
+    e.g. a MatchGraph's losses
+    groups: region ID of each player ID, as per group_players()
+    n_groups: number of regions
+    max_edges (optional): keep only this many of the heaviest
+    edges
+
+    output
+    ---------
+    src, dst: arrays of region IDs, src < dst, one per pair
+    of regions with sets between them, heaviest first
+    sets: array of the number of sets each pair played, either
+    direction
+    inside: array of the number of sets within each region
+    """
+    coo = losses.tocoo()
+    g1, g2 = groups[coo.row], groups[coo.col]
+    keep = (g1 >= 0) & (g2 >= 0)
+    g1, g2, counts = g1[keep], g2[keep], coo.data[keep].astype(np.int64)
+
+    same = g1 == g2
+    inside = np.bincount(g1[same], counts[same], n_groups).astype(np.int64)
+    pairs = sparse.coo_matrix((
+        counts[~same], (np.minimum(g1, g2)[~same], np.maximum(g1, g2)[~same])
+    ), shape=(n_groups, n_groups)).tocsr().tocoo()  # sums duplicates
+
+    order = np.lexsort((pairs.col, pairs.row, -pairs.data))[:max_edges]
+    return pairs.row[order], pairs.col[order], pairs.data[order], inside
+
+
+def width_classes(sets, n_widths=4):
+    """line width class (0 to n_widths - 1) of each edge, by
+    the log of its sets relative to the heaviest edge's
+    """
+    if not len(sets):
+        return np.zeros(0, dtype=np.int32)
+    scale = np.log1p(sets) / np.log1p(sets.max())
+    return np.minimum((scale * n_widths).astype(np.int32), n_widths - 1)
@@ -0,0 +1,286 @@
+"""
+in-process counters, gauges and histograms, exported in the
+Prometheus text format on a `/metrics` route of the Dash
+servers
+
+recording a sample is a dict lookup and a few additions
+under a lock; cache statistics that already exist elsewhere
+are read through collectors only when /metrics is scraped
+"""
+
+import bisect
+import threading
+import time
+
+UPDATE_PATH = '_dash-update-component'
+
+# upper bounds of histogram buckets, in seconds and bytes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536,
+                262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, _escape(v)) for k, v in pairs)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry(object):
+    """named metrics, each a counter, gauge or histogram with
+    one value per set of label values
+
+    metrics must be described before they're recorded, e.g.
+    registry.describe('requests_total', 'counter', 'requests')
+    registry.inc('requests_total', status='200')
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.meta = {}
+        self.values = {}
+        self.collectors = []
+
+    def describe(self, name, kind, help, buckets=None):
+        """declare metric `name` of type `kind` ('counter',
+        'gauge' or 'histogram', which takes `buckets`)
+        """
+        with self.lock:
+            self.meta.setdefault(name, (kind, help, buckets))
+            self.values.setdefault(name, {})
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.values[name]
+            values[key] = values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[name][key] = value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        buckets = self.meta[name][2]
+        i = bisect.bisect_left(buckets, value)
+        with self.lock:
+            values = self.values[name]
+            counts = values.get(key)
+            if counts is None:
+                # a count per bucket, then +Inf, then the sum
+                counts = values[key] = [0] * (len(buckets) + 2)
+            counts[i] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        """copy of every counter and histogram value, to pass
+        to since()
+        """
+        with self.lock:
+            return {
+                name: {k: list(v) if isinstance(v, list) else v
+                       for k, v in self.values[name].items()}
+                for name, (kind, _, _) in self.meta.items()
+                if kind in ('counter', 'histogram')
+            }
+
+    def since(self, snapshot):
+        """counts and observations recorded after `snapshot`,
+        in the form merge() takes, e.g. for a worker process to
+        send back with its results
+        """
+        recorded = {}
+        for name, values in self.snapshot().items():
+            old = snapshot.get(name, {})
+            for key, value in values.items():
+                if isinstance(value, list):
+                    before = old.get(key, [0] * len(value))
+                    delta = [v - b for v, b in zip(value, before)]
+                    if any(delta):
+                        recorded.setdefault(name, {})[key] = delta
+                elif value != old.get(key, 0):
+                    recorded.setdefault(name, {})[key] = value - old.get(key, 0)
+        return recorded
+
+    def merge(self, recorded):
+        """add counts and observations from since(), made in
+        another process, to this registry's
+        """
+        with self.lock:
+            for name, values in recorded.items():
+                mine = self.values.setdefault(name, {})
+                for key, value in values.items():
+                    if isinstance(value, list):
+                        counts = mine.setdefault(key, [0] * len(value))
+                        for i, v in enumerate(value):
+                            counts[i] += v
+                    else:
+                        mine[key] = mine.get(key, 0) + value
+
+    def add_collector(self, collect):
+        """call `collect()` on every render; it returns
+        (name, {labels}, value) samples of described counters
+        or gauges, e.g. read from a cache's stats()
+        """
+        self.collectors.append(collect)
+
+    def add_cache(self, stats, **labels):
+        """export a cache's hit and miss counts and size in
+        bytes, from `stats()` returning a dict with 'hits',
+        'misses' and optionally 'bytes'
+        """
+        def collect():
+            s = stats()
+            samples = [
+                ('cache_requests_total', dict(labels, result='hit'), s['hits']),
+                ('cache_requests_total', dict(labels, result='miss'), s['misses'])
+            ]
+            if 'bytes' in s:
+                samples.append(('cache_bytes', labels, s['bytes']))
+            return samples
+        self.add_collector(collect)
+
+    def render(self):
+        """all metrics in the Prometheus text exposition format"""
+        collected = {}
+        for collect in self.collectors:
+            for name, labels, value in collect():
+                key = tuple(sorted(labels.items()))
+                collected.setdefault(name, {})[key] = value
+
+        lines = []
+        with self.lock:
+            for name in sorted(self.meta):
+                kind, help, buckets = self.meta[name]
+                values = dict(self.values[name])
+                values.update(collected.get(name, {}))
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s %s' % (name, kind))
+                for key in sorted(values):
+                    value = values[key]
+                    if kind != 'histogram':
+                        lines.append('%s%s %s' % (name, _labels(key), _number(value)))
+                        continue
+                    total = 0
+                    for bound, count in zip(list(buckets) + [float('inf')], value):
+                        total += count
+                        lines.append('%s_bucket%s %d' % (
+                            name, _labels(key, [('le', _number(bound))]), total))
+                    lines.append('%s_sum%s %s' % (name, _labels(key), _number(value[-1])))
+                    lines.append('%s_count%s %d' % (name, _labels(key), total))
+        return '\n'.join(lines) + '\n'
+
+
+# the process wide registry everything records into
+REGISTRY = Registry()
+for _name, _kind, _help, _buckets in [
+        ('dash_callback_seconds', 'histogram',
+         'time to answer a callback request, hooks included', LATENCY_BUCKETS),
+        ('dash_callback_response_bytes', 'histogram',
+         'callback response body size as sent', SIZE_BUCKETS),
+        ('dash_callback_responses_total', 'counter',
+         'callback responses by HTTP status', None),
+        ('dash_preprocess_seconds', 'gauge',
+         'time each preprocessing phase took when its result was built', None),
+        ('dash_startup_seconds', 'gauge',
+         'time each startup phase of this worker took', None),
+        ('dash_compression_bytes_total', 'counter',
+         'callback response bytes before and after compression', None),
+        ('cache_requests_total', 'counter', 'cache lookups by result', None),
+        ('cache_bytes', 'gauge', 'bytes held by a cache', None),
+        ('sgg_requests_total', 'counter',
+         'smash.gg API requests by host and HTTP status', None),
+        ('sgg_request_seconds', 'histogram',
+         'smash.gg API request latency', LATENCY_BUCKETS)]:
+    REGISTRY.describe(_name, _kind, _help, _buckets)
+
+
+def set_timings(name, timings, registry=REGISTRY, **labels):
+    """set gauge `name` to each of {phase: seconds}, labelled by phase"""
+    for phase, seconds in timings.items():
+        registry.set(name, seconds, phase=phase, **labels)
+
+
+def export_compression(compressed_responses, app_name, registry=REGISTRY):
+    """export a response_pipeline.CompressedResponses' byte
+    counts and compressed body cache hits
+    """
+    def collect():
+        samples = []
+        hits = misses = 0
+        for output, c in compressed_responses.stats().items():
+            for kind in ('raw', 'sent'):
+                samples.append(('dash_compression_bytes_total',
+                                {'app': app_name, 'output': output, 'kind': kind},
+                                c['%s_bytes' % kind]))
+            hits += c['cache_hits']
+            misses += c['responses'] - c['cache_hits']
+        labels = {'app': app_name, 'cache': 'compressed'}
+        samples.append(('cache_requests_total', dict(labels, result='hit'), hits))
+        samples.append(('cache_requests_total', dict(labels, result='miss'), misses))
+        return samples
+    registry.add_collector(collect)
+
+
+def instrument(app, app_name, registry=REGISTRY, timing_header=False,
+               path='/metrics'):
+    """time and size every `_dash-update-component` response of
+    `app` and serve `registry` on `path`
+
+    install before any other request hooks, so the timing
+    covers them (before_request hooks run in the order they
+    were added, after_request hooks in reverse)
+
+    input
+    ---------
+    app: dash.Dash app
+    app_name: value of the `app` label
+    timing_header (optional): add a Server-Timing header with
+    the time taken to every response
+    """
+    import flask
+
+    server = app.server
+
+    @server.before_request
+    def start_request_timer():
+        flask.g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        start = flask.g.pop('metrics_start', None)
+        if start is None:
+            return response
+        seconds = time.perf_counter() - start
+        request = flask.request
+        if request.path.endswith(UPDATE_PATH):
+            output = (request.get_json(silent=True) or {}).get('output', '?')
+            registry.observe('dash_callback_seconds', seconds,
+                             app=app_name, output=output)
+            registry.inc('dash_callback_responses_total', app=app_name,
+                         output=output, status=str(response.status_code))
+            if not response.direct_passthrough:
+                registry.observe('dash_callback_response_bytes',
+                                 len(response.get_data()),
+                                 app=app_name, output=output)
+        if timing_header:
+            response.headers['Server-Timing'] = 'app;dur=%.2f' % (seconds * 1000)
+        return response
+
+    @server.route(path)
+    def metrics():
+        return flask.Response(registry.render(),
+                              mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,109 @@
+"""
+pair query engine for head to head comparisons: per player
+arrays of ranked opponents, so that comparing two players
+costs an array intersection bounded by their opponent counts
+rather than scans over every player in the dropdown
+
+a player's arrays come from their rows of the graph's sparse
+matrices, so any player in the graph can be compared; the
+arrays of the players given up front are built once and
+kept, anyone else's are built on first use and kept in a
+bounded LRU cache, so memory stays proportional to the
+players actually being looked at
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# number of players' arrays to keep beyond the precomputed ones
+ROW_CACHE_SIZE = 4096
+
+
+class PairQuery(object):
+    """ranked opponent records for the players of a graph
+
+    input
+    ---------
+    graph: smashgraph.MatchGraph
+    ranks: array of each graph ID's ranking, 0 for unranked,
+    as per MatchGraph.rankings()
+    players (optional): tags to precompute, e.g. the default
+    dropdown entries
+    cache_size (optional): number of other players' arrays
+    to keep
+    """
+
+    def __init__(self, graph, ranks, players=(), cache_size=ROW_CACHE_SIZE):
+        self.graph = graph
+        self.ranks = ranks
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        # tag: (ranked opponent IDs sorted by ID, the same IDs
+        # lowest ranked first, wins and losses aligned on those)
+        self.pinned = {p: self._build(p) for p in players}
+        self.rows = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, tag):
+        return tag in self.graph
+
+    def _build(self, player):
+        ids, wins, losses = self.graph.interactions(player)
+        ranked = self.ranks[ids] > 0
+        ids, wins, losses = ids[ranked], wins[ranked], losses[ranked]
+        order = np.argsort(-self.ranks[ids], kind='stable')
+        return ids, ids[order], wins[order], losses[order]
+
+    def row(self, player):
+        """a player's arrays, built if they aren't kept"""
+        row = self.pinned.get(player)
+        if row is not None:
+            return row
+        with self.lock:
+            row = self.rows.get(player)
+            if row is not None:
+                self.hits += 1
+                self.rows.move_to_end(player)
+                return row
+            self.misses += 1
+        # built outside the lock; two threads may both build a
+        # row, which is only wasted work
+        row = self._build(player)
+        with self.lock:
+            self.rows[player] = row
+            self.rows.move_to_end(player)
+            while len(self.rows) > self.cache_size:
+                self.rows.popitem(last=False)
+        return row
+
+    def bars(self, player, only=None):
+        """(opponent tags, wins, losses) against ranked opponents,
+        lowest ranked first, optionally limited to the sorted
+        IDs in `only`
+        """
+        _, ids, wins, losses = self.row(player)
+        if only is not None:
+            keep = np.isin(ids, only, assume_unique=True)
+            ids, wins, losses = ids[keep], wins[keep], losses[keep]
+        return self.graph.tag_array[ids].tolist(), wins.tolist(), losses.tolist()
+
+    def common_opponents(self, p1, p2):
+        """sorted IDs of ranked players both have played"""
+        return np.intersect1d(self.row(p1)[0], self.row(p2)[0], assume_unique=True)
+
+    def pair(self, p1, p2):
+        """bars() for each player against their common opponents"""
+        common = self.common_opponents(p1, p2)
+        return self.bars(p1, only=common), self.bars(p2, only=common)
+
+    def record(self, p1, p2):
+        """(sets p1 won, sets p2 won) between two players"""
+        return self.graph.record(p1, p2)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'pinned': len(self.pinned), 'cached': len(self.rows)}
@@ -0,0 +1,203 @@
+"""
+map-reduce ingestion of many tournaments across worker
+processes, for rebuilding seasons from phase groups that are
+already cached, where walking the json is the bottleneck
+
+tournaments are split into contiguous partitions; each worker
+reads its partitions' phase groups (decoding the cached json
+itself), builds a partial player table with get_sgg_players()
+and counts the decided sets by (loser, winner) entrant ID; the
+partials are then merged in partition order, and only then are
+entrant IDs mapped to tags through the merged table, so the
+result is exactly what get_sgg_players() followed by
+add_to_graph() give over the same phase groups serially, down
+to the order of the dicts' keys
+"""
+
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+import smashgg_constructor as sgg
+from sgg_cache import ResponseCache
+
+# partitions per worker process, so that a slow partition
+# doesn't leave the other processes idle at the end
+PARTITIONS_PER_PROCESS = 4
+
+
+def count_sets(phases, seen_sets=None):
+    """count the sets of phase groups by entrant IDs
+
+    input
+    ---------
+    phases: phase group json objects, as per get_sgg_phases()
+    seen_sets (optional): if given, also list the IDs of every
+    decided set, for add_to_graph()'s deduplication
+
+    output
+    ---------
+    counts: {(loser entrant ID, winner entrant ID): n sets},
+    as strings like get_sgg_players() keys, for every decided
+    set with no negative score; None for the pairs of sets
+    only listed
+    sets: [(set ID, pair)] of every decided set in order, or
+    None when not deduplicating
+    """
+    counts = {}
+    sets = [] if seen_sets is not None else None
+    for p in phases:
+        for s in p['entities']['sets']:
+            if s['winnerId'] is None:
+                continue
+            if s['entrant1Score'] >= 0 and s['entrant2Score'] >= 0:
+                pair = (str(s['loserId']), str(s['winnerId']))
+                counts[pair] = counts.get(pair, 0) + 1
+            else:
+                pair = None
+            if sets is not None:
+                sets.append((str(s['id']), pair))
+    return counts, sets
+
+
+def partition(items, n_parts):
+    """split `items` into at most `n_parts` contiguous lists
+    of nearly equal length, in order
+    """
+    n_parts = max(1, min(n_parts, len(items)))
+    size, extra = divmod(len(items), n_parts)
+    parts, start = [], 0
+    for i in range(n_parts):
+        end = start + size + (i < extra)
+        parts.append(items[start:end])
+        start = end
+    return parts
+
+
+# set in each worker process by _init_worker()
+_worker_cache = None
+
+
+def _init_worker(cache_path, max_bytes):
+    global _worker_cache
+    if cache_path is not None:
+        _worker_cache = ResponseCache(cache_path, max_bytes)
+
+
+def _map(tournaments, rankings, dedupe, fetch_kwargs, cache=None):
+    # the partial results of one partition of tournaments, and
+    # the metrics (cache hits, requests) recorded making them,
+    # which a worker process would otherwise keep to itself
+    if cache is None:
+        cache = _worker_cache
+    before = metrics.REGISTRY.snapshot()
+    phases = sgg.get_sgg_phases(tournaments, cache=cache, **fetch_kwargs)
+    players = sgg.get_sgg_players(phases, rankings)
+    counts = count_sets(phases, set() if dedupe else None)
+    return players, counts, metrics.REGISTRY.since(before)
+
+
+def merge(partials, players=None, graph=None, seen_sets=None, ids=None):
+    """combine the partial results of partitions, in order
+
+    input
+    ---------
+    partials: (players, (counts, sets)) per partition, as the
+    workers return them
+    players, graph, seen_sets (optional): as per get_sgg_players()
+    and add_to_graph(), extended in place
+    ids (optional): player_ids.PlayerIds to intern the players
+    in, in the order get_sgg_players() would
+
+    output
+    ---------
+    players: as per get_sgg_players()
+    graph: as per add_to_graph()
+    """
+    if players is None:
+        players = {}
+    if graph is None:
+        graph = defaultdict(lambda: defaultdict(int))
+
+    # player tables first, later partitions overwriting earlier
+    # ones like later phase groups do in get_sgg_players()
+    partials = list(partials)
+    for partial_players, _ in partials:
+        players.update(partial_players)
+        if ids is not None:
+            for p in partial_players.values():
+                p['id'] = ids.intern(p['player_id'], p['tag'])
+
+    for _, (counts, sets) in partials:
+        if seen_sets is not None:
+            # only the first time a set is seen counts
+            counts = {}
+            for set_id, pair in sets:
+                if set_id in seen_sets:
+                    continue
+                seen_sets.add(set_id)
+                if pair is not None:
+                    counts[pair] = counts.get(pair, 0) + 1
+        for (loser_id, winner_id), n in counts.items():
+            winner = players.get(winner_id)
+            loser = players.get(loser_id)
+            if winner is not None and loser is not None:
+                graph[sgg.player_key(loser)][sgg.player_key(winner)] += n
+
+    return players, graph
+
+
+def ingest_tournaments(tournaments, rankings, players=None, graph=None,
+                       seen_sets=None, processes=None, cache=None,
+                       ids=None, **fetch_kwargs):
+    """get_sgg_phases(), get_sgg_players() and add_to_graph()
+    over `tournaments`, partitioned by tournament across
+    `processes` worker processes (by default one per core),
+    each fetching its tournaments' phase groups through its
+    own copy of `cache`, so that decoding the cached json is
+    split across the workers too; only the partial tables and
+    counts come back to this process, never the phase groups
+
+    input
+    ---------
+    tournaments: as per get_sgg_phases()
+    rankings: as output by get_melee_rankings()
+    players, graph, seen_sets (optional): as per add_to_graph()
+    processes (optional): number of worker processes
+    cache (optional): sgg_cache.ResponseCache the workers open
+    by its path; phase groups it doesn't hold are fetched and
+    stored as get_sgg_phases() would
+    ids (optional): player_ids.PlayerIds, as per get_sgg_players();
+    the players are interned here, not in the workers
+    fetch_kwargs: passed on to get_sgg_phases() in each worker,
+    e.g. workers or rate_limit; rate_limit is the total, split
+    evenly between the worker processes
+
+    output
+    ---------
+    players: as per get_sgg_players()
+    graph: as per add_to_graph()
+    """
+    processes = processes or os.cpu_count() or 1
+    parts = partition(list(tournaments), processes * PARTITIONS_PER_PROCESS)
+    dedupe = seen_sets is not None
+    if processes <= 1:
+        # metrics are recorded straight into this process's registry
+        partials = [_map(part, rankings, dedupe, fetch_kwargs, cache)[:2]
+                    for part in parts]
+    else:
+        initargs = (cache.path, cache.max_bytes) if cache is not None else (None, None)
+        n = len(parts)
+        if fetch_kwargs.get('rate_limit'):
+            # each process limits only its own requests
+            fetch_kwargs = dict(fetch_kwargs,
+                                rate_limit=fetch_kwargs['rate_limit'] / min(processes, n))
+        with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                 initargs=initargs) as executor:
+            partials = []
+            for players_part, counts, recorded in executor.map(
+                    _map, parts, [rankings] * n, [dedupe] * n, [fetch_kwargs] * n):
+                metrics.REGISTRY.merge(recorded)
+                partials.append((players_part, counts))
+    return merge(partials, players, graph, seen_sets, ids)
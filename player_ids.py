@@ -0,0 +1,133 @@
+"""
+persistent identity table of players: every smash.gg player
+ID is interned to a compact integer, assigned in order of
+first sight and never reused, with the history of tags the
+player went by
+
+player tables and graphs built with a table key players by
+these integers rather than by tag, so a player who changes
+tag stays one player and two players sharing a tag stay two;
+tags are only attached again when exporting to the tag keyed
+files the dashboards read, through label(), which tells
+players sharing a tag apart: the first player to go by a tag
+keeps it as their label, anyone taking it after them gets
+their smash.gg player ID added, so a player's label only
+changes when they change tag
+"""
+
+import json
+import os
+
+IDS_PATH = 'data/player_ids.json'
+
+
+class PlayerIds(object):
+    """smash.gg player IDs interned to integers
+
+    input
+    ---------
+    path (optional): json file to keep the table in; read if
+    it exists, None to keep it in memory only
+    """
+
+    def __init__(self, path=IDS_PATH):
+        self.path = path
+        self.sgg_ids = []  # by integer ID: smash.gg player ID
+        self.history = []  # by integer ID: tags, oldest first
+        self.holders = {}  # tag: integer ID of its first player
+        if path is not None and os.path.exists(path):
+            with open(path) as file:
+                table = json.load(file)
+            self.sgg_ids = table['sgg_ids']
+            self.history = table['history']
+            self.holders = table.get('holders', {})
+        self.index = {s: i for i, s in enumerate(self.sgg_ids)}
+        self.by_tag = {}  # current tag: [integer IDs]
+        for i, tags in enumerate(self.history):
+            self.by_tag.setdefault(tags[-1], []).append(i)
+            # tables saved without holders: earliest ID first
+            for tag in tags:
+                self.holders.setdefault(tag, i)
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.sgg_ids)
+
+    def __contains__(self, sgg_id):
+        return str(sgg_id) in self.index
+
+    def intern(self, sgg_id, tag):
+        """integer ID of smash.gg player `sgg_id`, assigned if
+        new; `tag` becomes their current tag
+        """
+        sgg_id = str(sgg_id)
+        i = self.index.get(sgg_id)
+        if i is None:
+            i = self.index[sgg_id] = len(self.sgg_ids)
+            self.sgg_ids.append(sgg_id)
+            self.history.append([tag])
+            self.by_tag.setdefault(tag, []).append(i)
+            self.holders.setdefault(tag, i)
+            self.dirty = True
+        elif self.history[i][-1] != tag:
+            # tag change: drop the old tag's claim on the player
+            old = self.history[i][-1]
+            self.by_tag[old].remove(i)
+            if not self.by_tag[old]:
+                del self.by_tag[old]
+            if tag in self.history[i]:
+                self.history[i].remove(tag)
+            self.history[i].append(tag)
+            self.by_tag.setdefault(tag, []).append(i)
+            self.holders.setdefault(tag, i)
+            self.dirty = True
+        return i
+
+    def tag(self, i):
+        """current tag of integer ID `i`"""
+        return self.history[i][-1]
+
+    def lookup(self, tag):
+        """integer IDs of every player currently tagged `tag`"""
+        return list(self.by_tag.get(tag, ()))
+
+    def label(self, i):
+        """unique name of integer ID `i`: their current tag if
+        they were the first to go by it, 'tag (smash.gg player
+        ID)' otherwise, even once the first player has left it
+        """
+        tag = self.history[i][-1]
+        if self.holders[tag] != i:
+            return '%s (%s)' % (tag, self.sgg_ids[i])
+        return tag
+
+    def export_graph(self, graph):
+        """{losing player: {winning player: n wins}} keyed by
+        integer IDs, as add_to_graph() builds with a table,
+        keyed by label() instead, e.g. to save as
+        data/2017_lossgraph.json
+        """
+        return {
+            self.label(loser): {self.label(w): n for w, n in wins.items()}
+            for loser, wins in graph.items()
+        }
+
+    def export_players(self, players):
+        """player table from get_sgg_players() with a table,
+        keyed by label() instead of entrant ID, one entry per
+        player (their latest), like convert_players()
+        """
+        return {
+            self.label(p['id']): {k: v for k, v in p.items() if k != 'tag'}
+            for p in players.values()
+        }
+
+    def save(self):
+        if not self.dirty or self.path is None:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as file:
+            json.dump({'sgg_ids': self.sgg_ids, 'history': self.history,
+                       'holders': self.holders}, file)
+        os.replace(tmp, self.path)
+        self.dirty = False
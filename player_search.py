@@ -0,0 +1,215 @@
+"""
+search index over player tags and real names, for dropdowns
+that only ever send the client the top matches
+
+every tag and name is a key, numbered best first (by the
+players' priority, e.g. ranking); prefixes are found by
+binary search over the keys in sorted order, and substrings
+through a trigram index whose posting lists hold key numbers
+in that best first order, so a search stops as soon as it
+has enough matches instead of collecting all of them
+
+numpy is only imported once an index is built or searched, and
+an index pickles its arrays as lists, rebuilt on first use, so
+unpickling one (e.g. in a dashboard's cached state) doesn't
+import numpy
+"""
+
+import bisect
+
+# number of characters per gram of the substring index
+GRAM = 3
+# keys checked per step when scanning best first
+CHUNK = 4096
+# PlayerSearch attributes that are numpy arrays
+ARRAYS = ['owner', 'is_name', 'sorted_keys', 'position', 'postings']
+
+
+def normalize(text):
+    """casefold and collapse whitespace"""
+    return ' '.join(text.casefold().split())
+
+
+def grams(text):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class PlayerSearch(object):
+    """prefix and substring search over players
+
+    input
+    ---------
+    tags: player tags; a tag's position is its ID
+    names (optional): each tag's real name, or None
+    priority (optional): array of each tag's sort key, lower
+    first among equally good matches, e.g. the ranking with
+    unranked players set high; by default tags keep their order
+    """
+
+    def __init__(self, tags, names=None, priority=None):
+        import numpy as np
+        self.tags = list(tags)
+        self.names = list(names) if names is not None else [None] * len(self.tags)
+        if priority is None:
+            priority = np.arange(len(self.tags))
+        entries = [(normalize(t), i, False) for i, t in enumerate(self.tags)]
+        entries += [(normalize(n), i, True) for i, n in enumerate(self.names) if n]
+        entries = [e for e in entries if e[0]]
+        entries.sort(key=lambda e: (priority[e[1]], e[0]))
+
+        # keys by number, best first, the tag ID each belongs to,
+        # and whether it's a name rather than the tag
+        self.texts = [text for text, _, _ in entries]
+        self.owner = np.array([i for _, i, _ in entries], dtype=np.int32)
+        self.is_name = np.array([n for _, _, n in entries], dtype=bool)
+
+        # key numbers in alphabetical order, for prefixes
+        alphabetical = sorted(range(len(self.texts)), key=self.texts.__getitem__)
+        self.sorted_texts = [self.texts[k] for k in alphabetical]
+        self.sorted_keys = np.array(alphabetical, dtype=np.int32)
+        # and each key's position in that order
+        self.position = np.empty(len(alphabetical), dtype=np.int32)
+        self.position[self.sorted_keys] = np.arange(len(alphabetical))
+
+        # trigram posting lists, packed: the keys containing gram g
+        # are postings[bounds[g][0]:bounds[g][1]], ascending
+        gram_list, key_list = [], []
+        for k, text in enumerate(self.texts):
+            gs = grams(text)
+            gram_list.extend(gs)
+            key_list.extend([k] * len(gs))
+        gram_array = np.array(gram_list, dtype='<U%d' % GRAM)
+        key_array = np.array(key_list, dtype=np.int32)
+        order = np.lexsort((key_array, gram_array))
+        gram_array = gram_array[order]
+        self.postings = key_array[order]
+        starts = np.flatnonzero(np.r_[True, gram_array[1:] != gram_array[:-1]])
+        ends = np.r_[starts[1:], len(gram_array)]
+        self.bounds = dict(zip(gram_array[starts].tolist(),
+                               zip(starts.tolist(), ends.tolist())))
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        packed = state.pop('_packed', {})
+        for name in ARRAYS:
+            if name in state:
+                state[name] = (state[name].dtype.str, state[name].tolist())
+            else:
+                state[name] = packed[name]
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        packed = {name: state.pop(name) for name in ARRAYS}
+        self.__dict__.update(state)
+        self._packed = packed
+
+    def __getattr__(self, name):
+        # arrays left packed by unpickling, built on first use;
+        # threads racing here build the same array
+        packed = self.__dict__.get('_packed', {})
+        if name not in packed:
+            raise AttributeError(name)
+        import numpy as np
+        dtype, values = packed[name]
+        value = np.array(values, dtype=dtype)
+        setattr(self, name, value)
+        return value
+
+    def __len__(self):
+        return len(self.tags)
+
+    def _prefixed(self, query, n):
+        # the n best key numbers starting with `query`
+        import numpy as np
+        lo = bisect.bisect_left(self.sorted_texts, query)
+        hi = bisect.bisect_left(self.sorted_texts, query + '\U0010ffff')
+        if hi - lo <= CHUNK:
+            keys = self.sorted_keys[lo:hi]
+            if len(keys) > n:
+                keys = np.partition(keys, n - 1)[:n]
+            return np.sort(keys)
+        # common prefix: scan keys best first, a chunk at a time,
+        # for ones whose alphabetical position is in the range
+        found = []
+        for start in range(0, len(self.position), CHUNK):
+            chunk = self.position[start:start + CHUNK]
+            found.extend((np.flatnonzero((chunk >= lo) & (chunk < hi)) + start).tolist())
+            if len(found) >= n:
+                break
+        return np.array(found[:n], dtype=np.int32)
+
+    def _containing(self, query, n):
+        # the n best key numbers containing `query`, through its
+        # rarest trigram, checked in order until there are enough
+        import numpy as np
+        if len(query) < GRAM:
+            return np.zeros(0, dtype=np.int32)
+        spans = []
+        for g in grams(query):
+            if g not in self.bounds:
+                return np.zeros(0, dtype=np.int32)
+            spans.append(self.bounds[g])
+        lo, hi = min(spans, key=lambda s: s[1] - s[0])
+        candidates = self.postings[lo:hi]
+        if len(query) == GRAM:
+            return candidates[:n]
+        found = []
+        for start in range(0, len(candidates), n):
+            for k in candidates[start:start + n].tolist():
+                if query in self.texts[k]:
+                    found.append(k)
+            if len(found) >= n:
+                break
+        return np.array(found[:n], dtype=np.int32)
+
+    def search(self, query, limit=10):
+        """tag IDs of the best `limit` players matching `query`:
+        exact matches of a tag or name first, then prefixes,
+        then substrings, by priority within each and tags
+        before names; an empty query lists the players with
+        the highest priority
+        """
+        import numpy as np
+        query = normalize(query or '')
+        # each player has at most a tag and a name among the keys
+        n = 2 * limit
+        if not query:
+            keys = np.arange(min(n, len(self.texts)))
+            tiers = np.zeros(len(keys), dtype=np.int32)
+        else:
+            prefixed = self._prefixed(query, n)
+            containing = self._containing(query, n)
+            exact = np.array([self.texts[k] == query for k in prefixed.tolist()], dtype=bool)
+            keys = np.concatenate([prefixed, containing])
+            tiers = np.concatenate([
+                np.where(exact, 0, 1), np.full(len(containing), 2)
+            ]).astype(np.int32)
+
+        order = np.lexsort((keys, self.is_name[keys], tiers))
+        owners = self.owner[keys[order]]
+        _, first = np.unique(owners, return_index=True)
+        return owners[np.sort(first)][:limit].tolist()
+
+    def matches(self, query, limit=10):
+        """tags of search()"""
+        return [self.tags[i] for i in self.search(query, limit)]
+
+
+def dropdown_options(search, query, value=None, limit=10):
+    """dcc.Dropdown options for the best `limit` matches of
+    `query`, plus the current `value`; players found by their
+    name get it in their label too, since the dropdown filters
+    the options it's sent by label again
+    """
+    query = normalize(query or '')
+    options = []
+    for i in search.search(query, limit):
+        tag, name = search.tags[i], search.names[i]
+        if not name or query in normalize(tag):
+            options.append({'value': tag, 'label': tag})
+        else:
+            options.append({'value': tag, 'label': '%s (%s)' % (tag, name)})
+    if value is not None and value not in [o['value'] for o in options]:
+        options.append({'value': value, 'label': value})
+    return options
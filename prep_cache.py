@@ -0,0 +1,80 @@
+"""
+on-disk cache of the dashboards' preprocessed state, keyed
+on a hash of the input data files, so that only the first
+worker start after a data update pays for preprocessing
+and later starts just unpickle its result
+"""
+
+import glob
+import hashlib
+import os
+import pickle
+import time
+
+CACHE_DIR = '.dash_cache'
+
+
+class PhaseTimer(object):
+    """wall clock seconds taken by consecutive named phases
+    of a build, e.g. timer.lap('load') after loading
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.timings[phase] = now - self.last
+        self.last = now
+
+
+def file_digest(paths, version=0):
+    """sha256 hex digest over the contents of `paths`"""
+    digest = hashlib.sha256(str(version).encode())
+    for path in paths:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_state(name, build, inputs, version=0, cache_dir=CACHE_DIR):
+    """return build(), or the pickled result of an earlier
+    build() if none of the `inputs` files have changed since
+
+    input
+    ---------
+    name: prefix for the cache file, e.g. the module name
+    build: function taking no arguments that returns a
+    picklable object
+    inputs: list of paths of the files build() reads
+    version: bump when build() changes to invalidate old caches
+    cache_dir: directory to keep cache files in
+    """
+    key = file_digest(inputs, version)[:16]
+    path = os.path.join(cache_dir, '%s-%s.pkl' % (name, key))
+    try:
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    state = build()
+
+    # drop caches built from older inputs before writing ours;
+    # workers starting together may write the same file, or
+    # already have removed an old one
+    os.makedirs(cache_dir, exist_ok=True)
+    for old in glob.glob(os.path.join(cache_dir, '%s-*.pkl' % name)):
+        if os.path.abspath(old) == os.path.abspath(path):
+            continue
+        try:
+            os.remove(old)
+        except FileNotFoundError:
+            pass
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as file:
+        pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return state
@@ -0,0 +1,166 @@
+"""
+player ratings computed from results rather than taken from
+a hand maintained ranking: PageRank over the loss graph (each
+loss is a vote for the winner), and Elo and Glicko over the
+time ordered sets of a set_store.SetStore
+
+PageRank and Glicko are vectorized (sparse power iteration,
+and one batch of array updates per rating period); Elo is
+sequential by definition and runs as a plain loop over ints
+"""
+
+import numpy as np
+from scipy import sparse
+
+# series name each method's ranks are stored under in a
+# player's 'rankings', next to e.g. SSBMRank
+METHODS = ['PageRank', 'Elo', 'Glicko']
+
+GLICKO_Q = np.log(10) / 400
+WEEK = 7 * 24 * 60 * 60
+
+
+def pagerank(graph, damping=0.85, tol=1e-10, max_iter=200):
+    """PageRank of every player in a smashgraph.MatchGraph,
+    where each loss links the loser to the winner, weighted by
+    the number of sets; players who never lost spread their
+    score evenly, as do the (1 - damping) random jumps
+
+    output
+    ---------
+    scores: array aligned with graph.tags, summing to 1
+    """
+    n = len(graph)
+    if n == 0:
+        return np.zeros(0)
+    losses = graph.losses.astype(np.float64)
+    out = np.asarray(losses.sum(axis=1)).ravel()
+    dangling = out == 0
+    # column stochastic transition matrix: winners x losers
+    transition = (sparse.diags(1 / np.where(dangling, 1, out)) @ losses).T.tocsr()
+
+    scores = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        new = damping * (transition @ scores + scores[dangling].sum() / n)
+        new += (1 - damping) / n
+        if np.abs(new - scores).sum() < tol:
+            return new
+        scores = new
+    return scores
+
+
+def elo(winners, losers, n_players, k=32, initial=1500.0):
+    """Elo ratings after playing through sets in order
+
+    input
+    ---------
+    winners, losers: arrays of player IDs, one entry per set,
+    in the order the sets were played, e.g. a SetStore's
+    columns['winner'] and columns['loser']
+    n_players: number of IDs, e.g. len(store.tags)
+    k: points at stake per set
+
+    output
+    ---------
+    ratings: array of each ID's rating, `initial` if unplayed
+    """
+    ratings = [initial] * n_players
+    for w, l in zip(np.asarray(winners).tolist(), np.asarray(losers).tolist()):
+        expected = 1 / (1 + 10 ** ((ratings[l] - ratings[w]) / 400))
+        change = k * (1 - expected)
+        ratings[w] += change
+        ratings[l] -= change
+    return np.array(ratings)
+
+
+def _g(rd):
+    return 1 / np.sqrt(1 + 3 * GLICKO_Q ** 2 * rd ** 2 / np.pi ** 2)
+
+
+def glicko(winners, losers, times, n_players, period=WEEK,
+           initial=1500.0, initial_rd=350.0, c=34.6):
+    """Glicko ratings and rating deviations, with all sets in
+    the same rating period (`period` seconds) scored against
+    the ratings from before it, so each period is one batch of
+    array operations
+
+    input
+    ---------
+    winners, losers, times: arrays of player IDs and unix
+    seconds per set, sorted by time, e.g. a SetStore's columns
+    n_players: number of IDs
+    c: how fast deviation grows back per period without sets
+
+    output
+    ---------
+    ratings, deviations: arrays over the IDs
+    """
+    winners, losers = np.asarray(winners), np.asarray(losers)
+    ratings = np.full(n_players, initial)
+    rd = np.full(n_players, initial_rd)
+    last = np.zeros(n_players, dtype=np.int64)  # period of last update
+    if not len(winners):
+        return ratings, rd
+
+    periods = (np.asarray(times) - times[0]) // period
+    bounds = np.flatnonzero(np.diff(periods)) + 1
+    for games in np.split(np.arange(len(winners)), bounds):
+        p = periods[games[0]]
+        # each set as a game for both sides
+        player = np.concatenate([winners[games], losers[games]])
+        opponent = np.concatenate([losers[games], winners[games]])
+        score = np.repeat([1.0, 0.0], len(games))
+
+        # deviations grow with the periods each player sat out
+        active = np.unique(player)
+        rd[active] = np.minimum(
+            np.sqrt(rd[active] ** 2 + c ** 2 * (p - last[active])), initial_rd
+        )
+
+        g = _g(rd[opponent])
+        expected = 1 / (1 + 10 ** (-g * (ratings[player] - ratings[opponent]) / 400))
+        d2_inv = GLICKO_Q ** 2 * np.bincount(
+            player, g ** 2 * expected * (1 - expected), n_players)[active]
+        gains = np.bincount(player, g * (score - expected), n_players)[active]
+
+        denominator = 1 / rd[active] ** 2 + d2_inv
+        ratings[active] += GLICKO_Q / denominator * gains
+        rd[active] = np.sqrt(1 / denominator)
+        last[active] = p
+    return ratings, rd
+
+
+def scores(method, graph=None, store=None, **kwargs):
+    """({tag: score}, higher is better) by one of METHODS;
+    PageRank needs a MatchGraph, Elo and Glicko a SetStore
+    """
+    if method == 'PageRank':
+        return dict(zip(graph.tags, pagerank(graph, **kwargs).tolist()))
+    if store is None:
+        raise ValueError('%s ratings need a set store' % method)
+    columns = store.columns
+    if method == 'Elo':
+        values = elo(columns['winner'], columns['loser'], len(store.tags), **kwargs)
+    elif method == 'Glicko':
+        values = glicko(columns['winner'], columns['loser'], columns['time'],
+                        len(store.tags), **kwargs)[0]
+    else:
+        raise ValueError('unknown rating method %r' % method)
+    # players without sets keep the starting rating; leave them out
+    played = np.zeros(len(store.tags), dtype=bool)
+    played[columns['winner']] = played[columns['loser']] = True
+    return dict(zip(np.array(store.tags, dtype=object)[played].tolist(),
+                    values[played].tolist()))
+
+
+def add_rankings(players, scores, series, top=100):
+    """rank the `top` highest scored players 1, 2, ... and
+    store that under players[tag]['rankings'][series], like
+    the rankings from smash.gg, so everything that reads a
+    ranking series can use it; returns the ranked tags
+    """
+    ranked = sorted((t for t in scores if t in players),
+                    key=lambda t: -scores[t])[:top]
+    for rank, tag in enumerate(ranked, 1):
+        players[tag]['rankings'][series] = rank
+    return ranked
@@ -0,0 +1,229 @@
+"""
+faster Dash callback responses: serialize callback outputs
+with orjson instead of plotly's pure python encoder, and
+compress large `_dash-update-component` responses with
+brotli or gzip, keeping the compressed bytes of repeated
+outputs so they're only compressed once
+
+orjson and brotli are optional; without them responses are
+encoded with the standard encoder and compressed with gzip
+
+the fast encoder replaces the wrapper Dash puts around each
+callback with one that does the same work (Dash's own output
+validation included) but serializes with dumps(); it depends
+on how Dash lays out app.callback_map, so it's only used with
+the Dash versions in DASH_VERSIONS, which requirements.txt
+pins, and otherwise Dash's encoder is kept
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import warnings
+from collections import OrderedDict, defaultdict
+
+import dash
+import flask
+import plotly
+from dash import _validate
+from dash._utils import stringify_id
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+UPDATE_PATH = '_dash-update-component'
+# Dash versions (by prefix) whose callback wrapper and
+# callback_map layout _fast_callback() was written against;
+# keep the dash pin in requirements.txt in step
+DASH_VERSIONS = ('1.21.',)
+
+
+def _default(obj):
+    # plotly figures, numpy scalars and the like
+    if hasattr(obj, 'to_plotly_json'):
+        return obj.to_plotly_json()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+def dumps(obj):
+    """serialize to json bytes, NaN and infinities as null"""
+    if orjson is not None:
+        return orjson.dumps(
+            obj, default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(obj, cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')
+
+
+def _output(callback_id):
+    # the Output(s) of a callback, from the ID Dash keys it by
+    # in callback_map, e.g. 'map.figure' or '..a.src...a.style..'
+    if callback_id.startswith('..'):
+        return [_output(o) for o in callback_id[2:-2].split('...')]
+    component_id, prop = callback_id.rsplit('.', 1)
+    return dash.dependencies.Output(component_id, prop)
+
+
+def _fast_callback(func, callback_id):
+    # same response Dash builds for a callback's return value,
+    # with the same checks, see dash.Dash.callback, just
+    # serialized with dumps()
+    output = _output(callback_id)
+    multi = isinstance(output, list)
+    no_update = type(dash.no_update)
+
+    def dispatch(*args, **kwargs):
+        output_spec = kwargs.pop('outputs_list')
+        _validate.validate_output_spec(output, output_spec, dash.dependencies.Output)
+        output_value = func(*args, **kwargs)
+        if isinstance(output_value, no_update):
+            raise dash.exceptions.PreventUpdate
+        if not multi:
+            output_value, output_spec = [output_value], [output_spec]
+        _validate.validate_multi_return(output_spec, output_value, callback_id)
+
+        component_ids = defaultdict(dict)
+        for value, spec in zip(output_value, output_spec):
+            if isinstance(value, no_update):
+                continue
+            for v, s in zip(value, spec) if isinstance(spec, list) else [(value, spec)]:
+                if not isinstance(v, no_update):
+                    component_ids[stringify_id(s['id'])][s['property']] = v
+        if not component_ids:
+            raise dash.exceptions.PreventUpdate
+
+        try:
+            return dumps({'response': component_ids, 'multi': True})
+        except TypeError:
+            _validate.fail_callback_output(output_value, output)
+
+    dispatch.__wrapped__ = func
+    return dispatch
+
+
+def _unsupported(app):
+    # why the fast encoder can't stand in for Dash's, or None
+    if not dash.__version__.startswith(DASH_VERSIONS):
+        return 'Dash %s is not one of %s' % (dash.__version__, ', '.join(DASH_VERSIONS))
+    for callback_id, entry in app.callback_map.items():
+        if 'callback' not in entry:  # a client side callback
+            continue
+        if not hasattr(entry['callback'], '__wrapped__'):
+            return 'callback %s has no __wrapped__ function' % callback_id
+        if '{' in callback_id:
+            return 'callback %s has pattern matching outputs' % callback_id
+    return None
+
+
+def use_fast_encoder(app):
+    """serialize the responses of all of `app`'s callbacks
+    with dumps(); call once every callback is defined.
+    returns False, with a warning, if Dash's encoder had to
+    be kept instead
+    """
+    problem = _unsupported(app)
+    if problem is not None:
+        warnings.warn('keeping the Dash callback encoder: %s' % problem)
+        return False
+    for callback_id, entry in app.callback_map.items():
+        if 'callback' in entry:
+            entry['callback'] = _fast_callback(entry['callback'].__wrapped__, callback_id)
+    return True
+
+
+class CompressedResponses(object):
+    """compression of callback responses, with an LRU of
+    compressed bodies and per callback byte counts
+
+    input
+    ---------
+    min_size: responses smaller than this are sent as is
+    max_entries: number of compressed bodies to keep
+    gzip_level, brotli_quality: compression settings
+    """
+
+    def __init__(self, min_size=1024, max_entries=512,
+                 gzip_level=6, brotli_quality=5):
+        self.min_size = min_size
+        self.max_entries = max_entries
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.compressed = OrderedDict()
+        self.counts = defaultdict(lambda: {
+            'responses': 0, 'raw_bytes': 0, 'sent_bytes': 0, 'cache_hits': 0
+        })
+        self.lock = threading.Lock()
+
+    def encoding(self, accept):
+        if brotli is not None and 'br' in accept:
+            return 'br'
+        if 'gzip' in accept:
+            return 'gzip'
+        return None
+
+    def compress(self, data, encoding):
+        """return (compressed data, whether it was cached)"""
+        key = (encoding, hashlib.sha1(data).digest())
+        with self.lock:
+            if key in self.compressed:
+                self.compressed.move_to_end(key)
+                return self.compressed[key], True
+
+        if encoding == 'br':
+            out = brotli.compress(data, quality=self.brotli_quality)
+        else:
+            out = gzip.compress(data, compresslevel=self.gzip_level)
+
+        with self.lock:
+            self.compressed[key] = out
+            while len(self.compressed) > self.max_entries:
+                self.compressed.popitem(last=False)
+        return out, False
+
+    def install(self, app):
+        """compress `app`'s callback responses; install before
+        anything else that reads response bodies in after_request
+        """
+        @app.server.after_request
+        def compress_callback_response(response):
+            request = flask.request
+            if not request.path.endswith(UPDATE_PATH) or \
+                    response.status_code != 200 or response.direct_passthrough or \
+                    'Content-Encoding' in response.headers:
+                return response
+            encoding = self.encoding(request.headers.get('Accept-Encoding', ''))
+            data = response.get_data()
+            if encoding is None or len(data) < self.min_size:
+                return response
+
+            out, hit = self.compress(data, encoding)
+            response.set_data(out)
+            response.headers['Content-Encoding'] = encoding
+            response.headers['Content-Length'] = str(len(out))
+            response.vary.add('Accept-Encoding')
+
+            body = request.get_json(silent=True) or {}
+            with self.lock:
+                counts = self.counts[body.get('output', '?')]
+                counts['responses'] += 1
+                counts['raw_bytes'] += len(data)
+                counts['sent_bytes'] += len(out)
+                counts['cache_hits'] += hit
+            return response
+
+    def stats(self):
+        """{callback output: counts, including bytes saved}"""
+        with self.lock:
+            return {
+                output: dict(c, saved_bytes=c['raw_bytes'] - c['sent_bytes'])
+                for output, c in self.counts.items()
+            }
@@ -0,0 +1,261 @@
+"""
+time-indexed store of individual sets: when each was played,
+at which tournament and in which phase group, who won and who
+lost; the loss graph for any date window is built from the
+window's sets alone, found by binary search on time
+
+kept on disk as a single .npz of column arrays sorted by time
+"""
+
+import calendar
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+
+from smashgg_constructor import EntrantKeys
+from smashgraph import MatchGraph
+
+SETS_PATH = 'data/sets.npz'
+COLUMNS = [
+    ('id', np.int64),
+    ('time', np.int64),  # unix seconds
+    ('tournament', np.int64),  # -1 if unknown
+    ('phase_group', np.int64),
+    ('winner', np.int32),  # positions in the store's tags
+    ('loser', np.int32),
+]
+
+
+def sgg_sets(phases, players, tournament=None):
+    """yield a record for every decided, non-DQ set in
+    `phases` (the ones add_to_graph() counts) that has a
+    completedAt or startedAt time
+
+    input
+    ---------
+    phases: phase group json objects, as per get_sgg_phases()
+    players: as per get_sgg_players()
+    tournament (optional): ID of the tournament the phases
+    belong to, or {phase group ID: tournament ID}
+    """
+    for p in phases:
+        group_id = p['entities']['groups']['id']
+        t = tournament.get(group_id) if isinstance(tournament, dict) else tournament
+        keys = EntrantKeys(p, players)
+        for s in p['entities']['sets']:
+            winner = keys[s['winnerId']]
+            loser = keys[s['loserId']]
+            played = s.get('completedAt') or s.get('startedAt')
+            if winner is None or loser is None or played is None or \
+                    s['entrant1Score'] < 0 or s['entrant2Score'] < 0:
+                continue
+            yield {
+                'id': s['id'],
+                'time': played,
+                'tournament': -1 if t is None else t,
+                'phase_group': group_id,
+                'winner': winner,
+                'loser': loser
+            }
+
+
+def season_window(season):
+    """(start, end) unix seconds of a season name: a year,
+    e.g. '2017', or a half year, e.g. '2017-H2'
+    """
+    year, _, half = season.partition('-')
+    year = int(year)
+    if not half:
+        months = (1, 13)
+    elif half in ('H1', 'H2'):
+        months = (1, 7) if half == 'H1' else (7, 13)
+    else:
+        raise ValueError('unknown season %r' % season)
+
+    def month_start(month):
+        return calendar.timegm((year + (month - 1) // 12, (month - 1) % 12 + 1,
+                                1, 0, 0, 0))
+
+    return month_start(months[0]), month_start(months[1])
+
+
+class SetStore(object):
+    """sets sorted by time, with player tags interned to IDs
+
+    input
+    ---------
+    tags (optional): list of tags; a tag's position is its ID
+    columns (optional): {column name: array}, as per COLUMNS,
+    sorted by time
+    graph_cache_size (optional): number of window graphs to keep
+    """
+
+    def __init__(self, tags=(), columns=None, graph_cache_size=32):
+        self.tags = list(tags)
+        self.index = {t: i for i, t in enumerate(self.tags)}
+        if columns is None:
+            columns = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS}
+        self.columns = columns
+        self.graph_cache_size = graph_cache_size
+        self.lock = threading.Lock()
+        self._reindex()
+
+    def _reindex(self):
+        self.time = self.columns['time']
+        self.ids = np.sort(self.columns['id'])
+        # set positions ordered by tournament, for tournament lookups
+        self.by_tournament = np.argsort(self.columns['tournament'], kind='stable')
+        self.tournament_keys = self.columns['tournament'][self.by_tournament]
+        self.graphs = OrderedDict()
+
+    def __len__(self):
+        return len(self.time)
+
+    def tag_id(self, tag):
+        if tag not in self.index:
+            self.index[tag] = len(self.tags)
+            self.tags.append(tag)
+        return self.index[tag]
+
+    def add(self, sets):
+        """add set records (dicts with a key per column, winner
+        and loser as tags, or as players' integer IDs from a
+        player_ids.PlayerIds); sets already stored are skipped
+
+        output
+        ---------
+        n_new: number of sets added
+        """
+        rows = {name: [] for name, _ in COLUMNS}
+        seen = set()
+        for s in sets:
+            if s['id'] in seen:
+                continue
+            seen.add(s['id'])
+            for name, _ in COLUMNS:
+                value = s[name]
+                if name in ('winner', 'loser'):
+                    value = self.tag_id(value)
+                rows[name].append(value)
+
+        new = {name: np.array(rows[name], dtype=dtype) for name, dtype in COLUMNS}
+        keep = ~np.isin(new['id'], self.ids, assume_unique=True)
+        if not keep.any():
+            return 0
+
+        merged = {
+            name: np.concatenate([self.columns[name], new[name][keep]])
+            for name, _ in COLUMNS
+        }
+        order = np.lexsort((merged['id'], merged['time']))
+        self.columns = {name: column[order] for name, column in merged.items()}
+        self._reindex()
+        return int(keep.sum())
+
+    def add_phases(self, phases, players, tournament=None):
+        """add the sets of phase group json objects; arguments
+        as per sgg_sets(), output as per add()
+        """
+        return self.add(sgg_sets(phases, players, tournament))
+
+    def relabel(self, label):
+        """replace every tag by label(tag), e.g. integer IDs
+        by a player_ids.PlayerIds' label() before saving; the
+        labels must be distinct
+        """
+        self.tags = [label(t) for t in self.tags]
+        self.index = {t: i for i, t in enumerate(self.tags)}
+        self.graphs = OrderedDict()
+
+    def span(self):
+        """(first, last) set time, or None if empty"""
+        if not len(self):
+            return None
+        return int(self.time[0]), int(self.time[-1])
+
+    def window(self, start=None, end=None):
+        """slice of set positions with start <= time < end;
+        None leaves that side open
+        """
+        lo = 0 if start is None else np.searchsorted(self.time, start, 'left')
+        hi = len(self) if end is None else np.searchsorted(self.time, end, 'left')
+        return slice(int(lo), int(max(lo, hi)))
+
+    def _graph(self, positions):
+        losers = self.columns['loser'][positions]
+        winners = self.columns['winner'][positions]
+        n = len(self.tags)
+        losses = sparse.coo_matrix((
+            np.ones(len(losers), dtype=np.int32), (losers, winners)
+        ), shape=(n, n))
+        return MatchGraph(self.tags, losses)
+
+    def graph(self, start=None, end=None):
+        """smashgraph.MatchGraph of the sets played in
+        [start, end), over all of the store's tags; the most
+        recently used windows are cached
+        """
+        key = (start, end)
+        with self.lock:
+            graph = self.graphs.get(key)
+            if graph is not None:
+                self.graphs.move_to_end(key)
+                return graph
+        # built outside the lock, so threads serving other
+        # windows don't wait on it
+        graph = self._graph(self.window(start, end))
+        with self.lock:
+            self.graphs[key] = graph
+            self.graphs.move_to_end(key)
+            while len(self.graphs) > self.graph_cache_size:
+                self.graphs.popitem(last=False)
+        return graph
+
+    def season_graph(self, season):
+        """graph of a season, as named for season_window()"""
+        return self.graph(*season_window(season))
+
+    def tournament_graph(self, tournament):
+        """graph of the sets of one tournament ID"""
+        lo, hi = np.searchsorted(self.tournament_keys, [tournament, tournament + 1])
+        return self._graph(np.sort(self.by_tournament[lo:hi]))
+
+    def seasons(self):
+        """names of the years and half years that have sets,
+        oldest first
+        """
+        if not len(self):
+            return []
+        first, last = self.span()
+        seasons = []
+        for year in range(time.gmtime(first).tm_year, time.gmtime(last).tm_year + 1):
+            for season in ['%d' % year, '%d-H1' % year, '%d-H2' % year]:
+                window = self.window(*season_window(season))
+                if window.stop > window.start:
+                    seasons.append(season)
+        return seasons
+
+    def save(self, path=SETS_PATH):
+        """write the store as a .npz; a store of integer IDs is
+        saved as such, so that load() gives integer IDs back and
+        sets added after loading join the same players; a store
+        mixing tags and integer IDs can't be saved
+        """
+        ids = any(isinstance(t, int) for t in self.tags)
+        if ids and not all(isinstance(t, int) for t in self.tags):
+            raise ValueError('store mixes tags and integer IDs; relabel() it first')
+        tags = np.array(self.tags, dtype=np.int64 if ids else str)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, tags=tags, **self.columns)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=SETS_PATH):
+        with np.load(path) as data:
+            # integer IDs come back as ints, tags as strs
+            return cls(data['tags'].tolist(),
+                       {name: data[name] for name, _ in COLUMNS})
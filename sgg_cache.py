@@ -0,0 +1,150 @@
+"""
+content-addressed on-disk cache for smash.gg API responses,
+so that rebuilding the graphs does not re-download
+tournaments that have already finished
+
+each response lives in its own file named after the sha256
+of its URL, wrapped with its expiry time; a file's mtime
+doubles as its last-access time for LRU eviction
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_DIR = '.sgg_cache'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ResponseCache(object):
+    """cache of decoded json responses keyed by URL
+
+    input
+    ---------
+    path: directory to keep cached responses in
+    max_bytes: size cap; least recently used entries are
+    evicted once the cache grows past it; each process counts
+    only its own writes between evictions, so with several
+    processes sharing the directory it can overshoot by up to
+    their combined writes before one of them re-reads the size
+    """
+
+    def __init__(self, path=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    def _file(self, url):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest[:2], digest + '.json')
+
+    def _entries(self):
+        # (file, last access, size) for every cached response
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith('.json'):
+                    f = os.path.join(root, name)
+                    try:
+                        st = os.stat(f)
+                    except FileNotFoundError:
+                        continue  # evicted by another thread or process
+                    yield f, st.st_mtime, st.st_size
+
+    def get(self, url):
+        """return the cached json for `url`, or None if it was
+        never stored or has expired
+        """
+        f = self._file(url)
+        try:
+            with open(f) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            entry = None
+
+        with self.lock:
+            if entry is None or entry['url'] != url:
+                self.misses += 1
+                return None
+            if entry['expires'] is not None and entry['expires'] < time.time():
+                self.misses += 1
+                self._remove(f)
+                return None
+            self.hits += 1
+        try:
+            os.utime(f)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted since it was read
+        return entry['body']
+
+    def put(self, url, body, ttl=None):
+        """store json `body` for `url`; entries with a ttl
+        (in seconds) expire, entries without one are permanent
+        """
+        f = self._file(url)
+        data = json.dumps({
+            'url': url,
+            'expires': time.time() + ttl if ttl is not None else None,
+            'body': body
+        }).encode('utf-8')
+
+        with self.lock:
+            os.makedirs(os.path.dirname(f), exist_ok=True)
+            if os.path.exists(f):
+                self.total_bytes -= os.path.getsize(f)
+            # unique per process and thread, as forked workers share
+            # the directory and may reuse thread idents
+            tmp = '%s.%d.%d.tmp' % (f, os.getpid(), threading.get_ident())
+            with open(tmp, 'wb') as file:
+                file.write(data)
+            os.replace(tmp, f)
+            self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _remove(self, f):
+        try:
+            size = os.path.getsize(f)
+            os.remove(f)
+        except OSError:
+            return
+        self.total_bytes -= size
+
+    def _evict(self):
+        # drop least recently used entries down to 90% of the cap
+        # so that a full cache doesn't rescan on every put; the
+        # size is re-read from disk first, since other processes
+        # sharing the directory (e.g. parallel_ingest workers)
+        # add and evict entries this process hasn't counted
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        self.total_bytes = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for f, _, size in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(f)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass  # another process evicted it first
+            self.total_bytes -= size
+
+    def clear(self):
+        with self.lock:
+            for f, _, _ in list(self._entries()):
+                self._remove(f)
+
+    def stats(self):
+        """return hit/miss/eviction counters and current size"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'bytes': self.total_bytes
+        }
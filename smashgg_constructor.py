@@ -1,7 +1,13 @@
 # spencer stanley
 
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import requests
-from collections import defaultdict
+from requests.adapters import HTTPAdapter
+import metrics
 
 """
 functions to query data from smash.gg,
@@ -10,30 +16,134 @@ and then construct a graph of losses from
 this info
 """
 
+API_BASE = 'https://api.smash.gg'
+PHASE_GROUP_PATH = '/phase_group/%s?expand[]=sets&expand[]=seeds'
+RANKINGS_PATHS = [
+    '/rankings?per_page=100&filter={%22videogameIds%22:%221%22,'
+    '%22global%22:true,%22regional%22:%22state%22}',
+    '/rankings?expand[]=players&per_page=100&filter='
+    '{%22videogameIds%22:%221%22,%22regional%22:%22country%22}',
+    '/rankings?expand[]=players&per_page=100&filter='
+    '{%22videogameIds%22:%221%22,%22regional%22:%22subState%22}',
+]
 
-def get_melee_rankings():
+# seconds before cached responses that can still change go stale
+RANKINGS_TTL = 24 * 60 * 60
+OPEN_PHASE_GROUP_TTL = 10 * 60
+
+
+class HostRateLimiter(object):
+    """spread requests out so that no single host sees
+    more than `rate` requests per second, no matter how
+    many worker threads are sharing the limiter
+
+    input
+    ---------
+    rate: max requests per second per host (None or 0 = unlimited)
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        # reserve the next free slot for this host, then sleep
+        # outside the lock until that slot comes around
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(pool_size=10):
+    """return a requests.Session whose connection pool can
+    keep `pool_size` connections per host alive, so that
+    concurrent workers reuse sockets instead of reconnecting
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def cached_get(url, session=None, cache=None, ttl=None, limiter=None):
+    """return decoded json for `url`, from `cache` if it holds
+    a fresh copy and from the network otherwise
+
+    input
+    ---------
+    url: URL to GET
+    session (optional): requests.Session to send the request through
+    cache (optional): sgg_cache.ResponseCache to read from and fill
+    ttl (optional): seconds until the cached copy expires, None for
+    a permanent entry, or a function of the decoded json that
+    returns either of those
+    limiter (optional): HostRateLimiter to wait on before
+    going to the network
+    """
+    if cache is not None:
+        body = cache.get(url)
+        metrics.REGISTRY.inc('cache_requests_total', cache='sgg',
+                             result='miss' if body is None else 'hit')
+        if body is not None:
+            return body
+
+    if limiter is not None:
+        limiter.wait(url)
+    start = time.perf_counter()
+    response = (session or requests).get(url)
+    host = urlparse(url).netloc
+    metrics.REGISTRY.observe('sgg_request_seconds',
+                             time.perf_counter() - start, host=host)
+    metrics.REGISTRY.inc('sgg_requests_total', host=host,
+                         status=str(response.status_code))
+    # never parse, let alone cache, an error page
+    response.raise_for_status()
+    body = response.json()
+
+    if cache is not None:
+        cache.put(url, body, ttl=ttl(body) if callable(ttl) else ttl)
+    return body
+
+
+def phase_group_complete(phase):
+    """True if a phase group json object has sets and every
+    one of them has been decided, i.e. its results can no
+    longer change; a group without sets may not have been
+    published yet
+    """
+    sets = phase['entities'].get('sets') or []
+    return bool(sets) and all(s.get('winnerId') is not None for s in sets)
+
+
+def get_melee_rankings(session=None, cache=None, api_base=API_BASE):
     """get all regional, state, national, and multinational
     rankings for super smash bros melee
     
+    input
+    ---------
+    session (optional): requests.Session to query through
+    cache (optional): sgg_cache.ResponseCache; rankings are
+    cached for RANKINGS_TTL seconds since they get updated
+    api_base (optional): scheme and host of the sgg API
+
     output
     ---------
     rankings: dict of {ranking id: ranking name}
     """
-    rankings = requests.get(
-        'https://api.smash.gg/rankings?per_page=100&\
-        filter={%22videogameIds%22:%221%22,%22global%22:true,\
-        %22regional%22:%22state%22}'
-    ).json()['items']['entities']['rankingSeries']
-
-    rankings += requests.get(
-        'https://api.smash.gg/rankings?expand[]=players&per_page=100&\
-        filter={%22videogameIds%22:%221%22,%22regional%22:%22country%22}'
-    ).json()['items']['entities']['rankingSeries']
-
-    rankings += requests.get(
-        'https://api.smash.gg/rankings?expand[]=players&per_page=100&\
-        filter={%22videogameIds%22:%221%22,%22regional%22:%22subState%22}'
-    ).json()['items']['entities']['rankingSeries']
+    rankings = []
+    for path in RANKINGS_PATHS:
+        rankings += cached_get(
+            api_base + path, session=session, cache=cache, ttl=RANKINGS_TTL
+        )['items']['entities']['rankingSeries']
     
     rankings = {
         r['id']:r['name'] for r in rankings
@@ -42,7 +152,8 @@ def get_melee_rankings():
     return rankings
 
 
-def get_sgg_phases(tournaments):
+def get_sgg_phases(tournaments, workers=1, session=None,
+                   rate_limit=None, cache=None, api_base=API_BASE):
     """return list of json objects containing
     phase data for each given smash.gg tournament URL
     by querying the sgg API for each phase
@@ -53,6 +164,38 @@ def get_sgg_phases(tournaments):
     for smashgg tournament & event:
     e.g., for tournament t and event e at that tournament,
     http://api.smash.gg/tournament/t/event/e?expand[]=groups
+    workers (optional): number of phase groups to fetch
+    concurrently; 1 fetches them one after another
+    session (optional): requests.Session to share keep-alive
+    connections through; one is made if not given
+    rate_limit (optional): max requests per second per host
+    cache (optional): sgg_cache.ResponseCache; completed phase
+    groups are kept permanently, unfinished ones for
+    OPEN_PHASE_GROUP_TTL seconds
+    api_base (optional): scheme and host of the sgg API
+
+    output
+    ---------
+    phases: list of phase group json objects, in the same
+    order as the groups are listed in `tournaments`
+    """
+    return list(iter_sgg_phases(
+        tournaments, workers=workers, session=session,
+        rate_limit=rate_limit, cache=cache, api_base=api_base
+    ))
+
+
+def iter_sgg_phases(tournaments, workers=1, session=None,
+                    rate_limit=None, cache=None, api_base=API_BASE):
+    """generator version of get_sgg_phases(): yields phase
+    group json objects one at a time, in the same order,
+    with at most `workers` of them fetched ahead of the
+    consumer, so memory stays bounded by a handful of
+    phase groups instead of the whole tournament
+    
+    input
+    ---------
+    as per get_sgg_phases()
     """
     # get IDs of phase groups to query
     ids = []
@@ -60,32 +203,58 @@ def get_sgg_phases(tournaments):
         for phase_group in tournament['entities']['groups']:
             ids.append(phase_group['id'])
 
+    if session is None:
+        session = make_session(pool_size=workers)
+    limiter = HostRateLimiter(rate_limit)
+    base_url = api_base + PHASE_GROUP_PATH
+
+    def ttl(phase):
+        return None if phase_group_complete(phase) else OPEN_PHASE_GROUP_TTL
+
+    def fetch(pg_id):
+        return cached_get(base_url % pg_id, session=session, cache=cache,
+                          ttl=ttl, limiter=limiter)
+
     # query smashgg API for each phase group
-    phases = []
-    base_url = 'http://api.smash.gg/phase_group/%s\
-                ?expand[]=sets&expand[]=seeds'
-    for pg_id in ids:
-        phases.append(
-            requests.get(base_url % pg_id).json()  # append json objects
-        )
+    if workers <= 1:
+        for pg_id in ids:
+            yield fetch(pg_id)
+        return
 
-    return phases
+    # keep a window of `workers` requests in flight and hand
+    # results back in submission order as they complete
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for pg_id in ids:
+            pending.append(executor.submit(fetch, pg_id))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 
-def get_sgg_players(phases, rankings):
+def get_sgg_players(phases, rankings, players=None, ids=None):
     """return {player id: {various player information}}
     for given smash.gg tournament's phases and
     a dictionary of {ranking id: ranking name}
     
     input
     ---------
-    phases: as output by get_sgg_phases()
+    phases: as output by get_sgg_phases(), or any
+    iterable of phase group json objects
     rankings: as output by get_melee_rankings()
+    players (optional): include to add to a preexisting
+    player table in place
+    ids (optional): player_ids.PlayerIds to intern every
+    player's smash.gg player ID in; the players then get an
+    'id', which add_to_graph() keys them by instead of tag
     
     output
     ---------
     players: {player id:{
         tag: player's gamertag
+        player_id: player's smash.gg player ID,
+        id: player's integer ID, if `ids` is given
         name: player's real name,
         country: player's home country,
         state: if country is US or Canada, then state/province,
@@ -95,16 +264,18 @@ def get_sgg_players(phases, rankings):
         }
     }
     """
-    players = {}
+    if players is None:
+        players = {}
 
     for p in phases:
         for s in p['entities']['seeds']:
-            pid = s['mutations']['entrants'].keys()[0]
-            p_info = s['mutations']['players'].values()[0]
+            pid = next(iter(s['mutations']['entrants']))
+            p_info = next(iter(s['mutations']['players'].values()))
             players.update(
                 {pid: 
                  {
                      'tag': p_info['gamerTag'],
+                     'player_id': p_info['id'],
                      'name': p_info['name'],
                      'country': p_info['country'],
                      'state': p_info['state'],
@@ -123,6 +294,8 @@ def get_sgg_players(phases, rankings):
                  }
                 }
             )
+            if ids is not None:
+                players[pid]['id'] = ids.intern(p_info['id'], p_info['gamerTag'])
 
     return players
 
@@ -153,7 +326,39 @@ def convert_players(pid_to_dict):
     return players
 
 
-def add_to_graph(phases, players, graph=None):
+def player_key(player):
+    """what a player (a get_sgg_players() entry) is keyed by
+    in graphs: their integer ID if they were interned, their
+    tag otherwise
+    """
+    return player['id'] if 'id' in player else player['tag']
+
+
+class EntrantKeys(dict):
+    """{entrant ID: player_key()} of one phase group, keyed by
+    the integers sets give as winnerId and loserId, so joining a
+    group's sets to players doesn't convert and hash every ID
+    against the player table's string keys; filled from the
+    group's seeds, with entrants seeded elsewhere looked up in
+    `players` once and kept (None if not there)
+    """
+
+    def __init__(self, phase, players):
+        dict.__init__(self)
+        self.players = players
+        for s in phase['entities']['seeds']:
+            for pid in s['mutations']['entrants']:
+                player = players.get(pid)
+                if player is not None:
+                    self[int(pid)] = player_key(player)
+
+    def __missing__(self, entrant_id):
+        player = self.players.get(str(entrant_id))
+        key = self[entrant_id] = player_key(player) if player is not None else None
+        return key
+
+
+def add_to_graph(phases, players, graph=None, seen_sets=None):
     """add player losses for a tournament's phases
     to graph for analysis
 
@@ -165,20 +370,83 @@ def add_to_graph(phases, players, graph=None):
     graph (optional): include if appending tournaments to
     preexisting data; should be of the form
     defaultdict(lambda: defaultdict(int))
+    seen_sets (optional): set of IDs of sets already counted
+    in `graph`; those are skipped, and every decided set
+    handled here is added to it
 
     output
     ---------
-    graph: dictionary of {losing player : {winning player : n wins}}
+    graph: dictionary of {losing player : {winning player : n wins}},
+    players as per player_key()
     """
     if graph is None:
         graph = defaultdict(lambda: defaultdict(int))
 
     for p in phases:
+        keys = EntrantKeys(p, players)
         for s in p['entities']['sets']:
-            winner = players.get(str(s['winnerId']))
-            loser = players.get(str(s['loserId']))
+            if seen_sets is not None and s['winnerId'] is not None:
+                if str(s['id']) in seen_sets:
+                    continue
+                seen_sets.add(str(s['id']))
+            winner = keys[s['winnerId']]
+            loser = keys[s['loserId']]
             if winner is not None and loser is not None and \
                 s['entrant1Score'] >= 0 and s['entrant2Score'] >= 0:
-                graph[loser['tag']][winner['tag']] += 1
+                graph[loser][winner] += 1
+
+    return graph
+
+
+def stream_tournaments(tournaments, rankings, players=None, graph=None,
+                       store=None, geocoder=None, ids=None, **fetch_kwargs):
+    """fetch, parse and count a list of tournaments one phase
+    group at a time: each phase group's seeds go into the
+    player table and its sets into the graph before the next
+    one is read, so peak memory is bounded by a phase group
+    rather than by the whole list of phases
+
+    input
+    ---------
+    tournaments: as per get_sgg_phases()
+    rankings: as output by get_melee_rankings()
+    players (optional): player table to extend, as per get_sgg_players()
+    graph (optional): graph to extend, as per add_to_graph()
+    store (optional): set_store.SetStore to also add every set
+    to, with its time, tournament and phase group
+    geocoder (optional): geocode.Geocoder to set the 'latlon'
+    of new players with, once every phase group is read
+    ids (optional): player_ids.PlayerIds to intern players in,
+    as per get_sgg_players(); saved once every phase group is read
+    fetch_kwargs: passed on to iter_sgg_phases()
+
+    output
+    ---------
+    players: as per get_sgg_players()
+    graph: as per add_to_graph()
+    """
+    if players is None:
+        players = {}
+    if graph is None:
+        graph = defaultdict(lambda: defaultdict(int))
+
+    # tournament of each phase group, from the event json
+    group_tournament = {
+        pg['id']: t['entities'].get('event', {}).get('tournamentId')
+        for t in tournaments for pg in t['entities']['groups']
+    }
+
+    for phase in iter_sgg_phases(tournaments, **fetch_kwargs):
+        # sets only ever involve entrants seeded in the same group
+        get_sgg_players([phase], rankings, players=players, ids=ids)
+        add_to_graph([phase], players, graph=graph)
+        if store is not None:
+            store.add_phases([phase], players, tournament=group_tournament)
+
+    # one batch of distinct locations for the whole run
+    if geocoder is not None:
+        geocoder.geocode(players)
+    if ids is not None:
+        ids.save()
 
-    return graph
\ No newline at end of file
+    return players, graph
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+sparse matrix core for the win/loss graphs: tags are
+mapped to integer IDs and results stored as a CSR matrix
+of losses, with the win view derived as its transpose,
+so only the loss graph has to be read from disk
+"""
+
+import json
+import numpy as np
+from scipy import sparse
+
+
+class MatchGraph(object):
+    """head to head results between players
+
+    input
+    ---------
+    tags: list of player tags; a tag's position is its ID
+    losses: sparse matrix where losses[i, j] is the number
+    of times player i lost to player j
+    wins (optional): its transpose as a CSR matrix, if already
+    built
+    index (optional): {tag: ID} mapping, if already built; `tags`
+    is then kept as given rather than copied to a list
+    """
+
+    def __init__(self, tags, losses, wins=None, index=None):
+        self.tags = list(tags) if index is None else tags
+        self._index = index
+        self._tag_array = None
+        self.losses = sparse.csr_matrix(losses, dtype=np.int32)
+        self.losses.sum_duplicates()
+        if wins is None:
+            wins = self.losses.T.tocsr()  # wins[i, j]: times i beat j
+            wins.sort_indices()
+        self.wins = wins
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {t: i for i, t in enumerate(self.tags)}
+        return self._index
+
+    @property
+    def tag_array(self):
+        if self._tag_array is None:
+            self._tag_array = np.array(list(self.tags), dtype=object)
+        return self._tag_array
+
+    @classmethod
+    def from_lossgraph(cls, lossgraph, tags=None):
+        """build from {losing player: {winning player: n wins}},
+        as output by smashgg_constructor.add_to_graph(); pass
+        `tags` to fix the ID order (extra tags get empty rows)
+        """
+        tags = list(tags) if tags is not None else []
+        index = {t: i for i, t in enumerate(tags)}
+
+        def tag_id(t):
+            if t not in index:
+                index[t] = len(tags)
+                tags.append(t)
+            return index[t]
+
+        rows, cols, counts = [], [], []
+        for loser, wins in lossgraph.items():
+            i = tag_id(loser)
+            for winner, n in wins.items():
+                rows.append(i)
+                cols.append(tag_id(winner))
+                counts.append(n)
+
+        losses = sparse.coo_matrix(
+            (counts, (rows, cols)), shape=(len(tags), len(tags))
+        )
+        return cls(tags, losses)
+
+    @classmethod
+    def from_csr(cls, tags, indptr, indices, data, wins=None, index=None):
+        """build from the arrays of a CSR loss matrix without
+        copying them, e.g. arrays mapped from a snapshot file;
+        indices must already be sorted within each row
+
+        input
+        ---------
+        wins (optional): (indptr, indices, data) of the win
+        matrix in the same form, to skip transposing
+        index (optional): as per MatchGraph
+        """
+        n = len(tags)
+
+        def csr(data, indices, indptr):
+            matrix = sparse.csr_matrix((data, indices, indptr), shape=(n, n),
+                                       copy=False)
+            matrix.has_canonical_format = True
+            return matrix
+
+        losses = csr(data, indices, indptr)
+        if wins is not None:
+            wins = csr(wins[2], wins[1], wins[0])
+        return cls(tags, losses, wins, index)
+
+    def __contains__(self, tag):
+        return tag in self.index
+
+    def __len__(self):
+        return len(self.tags)
+
+    @staticmethod
+    def _row(matrix, i):
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        return matrix.indices[start:end], matrix.data[start:end]
+
+    def beat(self, tag):
+        """(sorted opponent IDs, n wins) for everyone `tag` beat"""
+        return self._row(self.wins, self.index[tag])
+
+    def lost_to(self, tag):
+        """(sorted opponent IDs, n losses) for everyone `tag` lost to"""
+        return self._row(self.losses, self.index[tag])
+
+    def record(self, p1, p2):
+        """(sets p1 won, sets p2 won) between two players"""
+        i, j = self.index[p1], self.index[p2]
+        return int(self.wins[i, j]), int(self.wins[j, i])
+
+    def opponents(self, tag):
+        """sorted array of IDs of everyone `tag` played"""
+        return np.union1d(self.beat(tag)[0], self.lost_to(tag)[0])
+
+    def interactions(self, tag):
+        """(sorted opponent IDs, wins, losses) for `tag`, with
+        wins and losses aligned on the opponent array
+        """
+        win_ids, win_counts = self.beat(tag)
+        loss_ids, loss_counts = self.lost_to(tag)
+        ids = np.union1d(win_ids, loss_ids)
+        wins = np.zeros(len(ids), dtype=np.int32)
+        losses = np.zeros(len(ids), dtype=np.int32)
+        wins[np.searchsorted(ids, win_ids)] = win_counts
+        losses[np.searchsorted(ids, loss_ids)] = loss_counts
+        return ids, wins, losses
+
+    def rankings(self, players, series='SSBMRank'):
+        """array of each ID's rank in `series`, 0 for unranked"""
+        return np.array([
+            players[t]['rankings'].get(series, 0) if t in players else 0
+            for t in self.tags
+        ], dtype=np.int32)
+
+    def to_dict(self, view='losses'):
+        """nested {tag: {tag: count}} dict of the 'losses' or
+        'wins' view, in the format of data/2017_*graph.json
+        """
+        matrix = self.losses if view == 'losses' else self.wins
+        graph = {}
+        for i, tag in enumerate(self.tags):
+            ids, counts = self._row(matrix, i)
+            if len(ids):
+                graph[tag] = dict(zip(self.tag_array[ids], counts.tolist()))
+        return graph
+
+
+def load_graph(path='data/2017_lossgraph.json'):
+    """load a loss graph json file into a MatchGraph"""
+    with open(path) as file:
+        return MatchGraph.from_lossgraph(json.load(file))
@@ -0,0 +1,394 @@
+"""
+compiled, memory-mappable snapshot of the dashboard data:
+players.json, citystates.json and the loss graph packed into
+one binary file of flat arrays plus an interned string table
+
+build it after updating the json sources with
+python snapshot.py build [snapshot path]
+
+the file is mapped read-only, so its arrays (both views of
+the graph, the player columns and the string table) are
+shared between every process that opens it; opening reads
+only the header, strings are decoded one at a time when first
+used, players are looked up by binary search over their tags
+in sorted order and their dicts built on first access, so a
+process pays for the parts of the data it touches;
+load_data() falls back to the json files when there is no up
+to date snapshot
+"""
+
+import json
+import mmap
+from collections.abc import Mapping, Sequence
+import os
+import struct
+import sys
+
+import numpy as np
+
+from smashgraph import MatchGraph
+
+MAGIC = b'SSBMSNP2'
+ALIGN = 64
+
+SNAPSHOT_PATH = 'data/snapshot.bin'
+PLAYERS_PATH = 'data/players.json'
+CITYSTATES_PATH = 'data/citystates.json'
+LOSSGRAPH_PATH = 'data/2017_lossgraph.json'
+
+PLAYER_STRINGS = ['name', 'citystate', 'region', 'state', 'country']
+
+
+def load_json_data(players_path=PLAYERS_PATH, citystates_path=CITYSTATES_PATH,
+                   lossgraph_path=LOSSGRAPH_PATH):
+    """load the dashboard data straight from the json sources
+
+    output
+    ---------
+    players: {tag: player info}, as in data/players.json
+    cs_geo: {city, state: [lat, lon]}, as in data/citystates.json
+    graph: smashgraph.MatchGraph of the loss graph
+    """
+    with open(players_path) as file:
+        players = json.load(file)
+    with open(citystates_path) as file:
+        cs_geo = json.load(file)
+    with open(lossgraph_path) as file:
+        graph = MatchGraph.from_lossgraph(json.load(file), tags=list(players))
+    return players, cs_geo, graph
+
+
+def load_data(path=SNAPSHOT_PATH, players_path=PLAYERS_PATH,
+              citystates_path=CITYSTATES_PATH, lossgraph_path=LOSSGRAPH_PATH):
+    """load the dashboard data from the snapshot at `path`,
+    or from the json sources if the snapshot is missing or
+    older than they are; output as per load_json_data()
+    """
+    sources = [players_path, citystates_path, lossgraph_path]
+    try:
+        snap = Snapshot(path)
+    except (OSError, ValueError):
+        return load_json_data(*sources)
+    if snap.sources != _source_stamps(sources):
+        return load_json_data(*sources)
+    return snap.players(), snap.citystates(), snap.graph()
+
+
+def _source_stamps(paths):
+    return [[os.path.basename(p), os.path.getsize(p), os.stat(p).st_mtime_ns]
+            for p in paths]
+
+
+def _sorted_order(strings):
+    # positions of `strings` in sorted order, for _Lookup
+    strings = list(strings)
+    return np.array(sorted(range(len(strings)), key=strings.__getitem__),
+                    dtype=np.int32)
+
+
+class _StringTable(object):
+    """interns strings to int32 IDs while building; None is -1"""
+
+    def __init__(self):
+        self.ids = {}
+
+    def __call__(self, s):
+        if s is None:
+            return -1
+        if s not in self.ids:
+            self.ids[s] = len(self.ids)
+        return self.ids[s]
+
+    def arrays(self):
+        encoded = [s.encode('utf-8') for s in self.ids]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return blob, offsets
+
+
+def build(path=SNAPSHOT_PATH, players_path=PLAYERS_PATH,
+          citystates_path=CITYSTATES_PATH, lossgraph_path=LOSSGRAPH_PATH):
+    """compile the json sources into a snapshot file at `path`"""
+    players, cs_geo, graph = load_json_data(
+        players_path, citystates_path, lossgraph_path
+    )
+    intern = _StringTable()
+    tags = list(players)
+    n = len(tags)
+    arrays = {}
+
+    arrays['player_tag'] = np.array([intern(t) for t in tags], dtype=np.int32)
+    arrays['player_order'] = _sorted_order(tags)
+    for field in PLAYER_STRINGS:
+        arrays['player_' + field] = np.array(
+            [intern(players[t][field]) for t in tags], dtype=np.int32
+        )
+
+    latlon = np.full((n, 2), np.nan)
+    offset = np.zeros((n, 2))
+    image_url = np.full(n, -1, dtype=np.int32)
+    image_size = np.zeros((n, 2), dtype=np.int32)
+    rank_indptr = np.zeros(n + 1, dtype=np.int32)
+    rank_series, rank_value = [], []
+    for i, t in enumerate(tags):
+        info = players[t]
+        if info.get('latlon') is not None:
+            latlon[i] = info['latlon']
+        offset[i] = info.get('offset') or (0.0, 0.0)
+        if info['image'] is not None:
+            image_url[i] = intern(info['image']['url'])
+            image_size[i] = info['image']['height'], info['image']['width']
+        for series, rank in info['rankings'].items():
+            rank_series.append(intern(series))
+            rank_value.append(rank)
+        rank_indptr[i + 1] = len(rank_series)
+    arrays.update({
+        'player_latlon': latlon,
+        'player_offset': offset,
+        'player_image_url': image_url,
+        'player_image_size': image_size,
+        'rank_indptr': rank_indptr,
+        'rank_series': np.array(rank_series, dtype=np.int32),
+        'rank_value': np.array(rank_value, dtype=np.int32),
+    })
+
+    cities = list(cs_geo)
+    arrays['city_name'] = np.array([intern(c) for c in cities], dtype=np.int32)
+    arrays['city_latlon'] = np.array(
+        [cs_geo[c] for c in cities], dtype=np.float64
+    ).reshape(-1, 2)
+
+    losses, wins = graph.losses, graph.wins
+    arrays['graph_tag'] = np.array([intern(t) for t in graph.tags], dtype=np.int32)
+    arrays['graph_order'] = _sorted_order(graph.tags)
+    arrays['graph_indptr'] = losses.indptr.astype(np.int32)
+    arrays['graph_indices'] = losses.indices.astype(np.int32)
+    arrays['graph_data'] = losses.data.astype(np.int32)
+    arrays['wins_indptr'] = wins.indptr.astype(np.int32)
+    arrays['wins_indices'] = wins.indices.astype(np.int32)
+    arrays['wins_data'] = wins.data.astype(np.int32)
+
+    arrays['strings_blob'], arrays['strings_offsets'] = intern.arrays()
+
+    # lay the arrays out back to back, each aligned, after the header
+    toc = {}
+    position = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        toc[name] = [position, array.dtype.str, list(array.shape)]
+        position += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps({
+        'arrays': toc,
+        'sources': _source_stamps([players_path, citystates_path, lossgraph_path])
+    }).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as file:
+        file.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        for name, array in arrays.items():
+            file.seek(data_start + toc[name][0])
+            file.write(array.tobytes())
+    os.replace(tmp, path)
+
+
+class _Strings(object):
+    """the mapped string table, each string decoded on first use"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+        self.decoded = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, sid):
+        s = self.decoded.get(sid)
+        if s is None:
+            start, end = int(self.offsets[sid]), int(self.offsets[sid + 1])
+            s = self.decoded[sid] = self.blob[start:end].tobytes().decode('utf-8')
+        return s
+
+
+class _Column(Sequence):
+    """list-like view of a mapped column of string IDs, e.g.
+    the graph's tags in ID order; pickles as a plain list
+    """
+
+    def __init__(self, strings, ids):
+        self.strings = strings
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.strings[sid] for sid in self.ids[i].tolist()]
+        return self.strings[int(self.ids[i])]
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+class _Lookup(Mapping):
+    """{string: position} of a _Column, by binary search over
+    its positions in sorted order, as stored by build(); pickles
+    as a plain dict
+    """
+
+    def __init__(self, column, order):
+        self.column = column
+        self.order = order
+
+    def _find(self, key):
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.column[int(self.order[mid])] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.order) and self.column[int(self.order[lo])] == key:
+            return int(self.order[lo])
+        return -1
+
+    def __getitem__(self, key):
+        i = self._find(key) if isinstance(key, str) else -1
+        if i < 0:
+            raise KeyError(key)
+        return i
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self._find(key) >= 0
+
+    def __iter__(self):
+        return iter(self.column)
+
+    def __len__(self):
+        return len(self.column)
+
+    def __reduce__(self):
+        return dict, ({s: i for i, s in enumerate(self.column)},)
+
+
+class _Players(Mapping):
+    """{tag: player info}, as in data/players.json, over the
+    mapped player columns; an entry's dict is built on first
+    access and kept, so changes made to it stick; pickles as a
+    plain dict
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        a = snapshot.arrays
+        self.tags = _Column(snapshot.strings, a['player_tag'])
+        self.lookup = _Lookup(self.tags, a['player_order'])
+        self.built = {}
+
+    def __getitem__(self, tag):
+        i = self.lookup[tag]
+        info = self.built.get(i)
+        if info is None:
+            # another thread may build it too; keep the first
+            info = self.built.setdefault(i, self.snapshot.player(i))
+        return info
+
+    def __contains__(self, tag):
+        return tag in self.lookup
+
+    def __iter__(self):
+        return iter(self.tags)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __reduce__(self):
+        return dict, (dict(self.items()),)
+
+
+class Snapshot(object):
+    """read-only view of a snapshot file; arrays are backed
+    directly by the shared memory map
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not a snapshot file' % path)
+        (header_len,) = struct.unpack_from('<Q', self.map, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(self.map[start:start + header_len].decode('utf-8'))
+        self.sources = header['sources']
+        data_start = -(-(start + header_len) // ALIGN) * ALIGN
+
+        self.arrays = {}
+        for name, (offset, dtype, shape) in header['arrays'].items():
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape))
+            self.arrays[name] = np.frombuffer(
+                self.map, dtype=dtype, count=count, offset=data_start + offset
+            ).reshape(shape)
+
+        # everything else refers to strings by ID
+        self.strings = _Strings(self.arrays['strings_blob'],
+                                self.arrays['strings_offsets'])
+
+    def string(self, sid):
+        return self.strings[sid] if sid >= 0 else None
+
+    def player(self, i):
+        """player info of the player at position `i`"""
+        a = self.arrays
+        info = {f: self.string(int(a['player_' + f][i])) for f in PLAYER_STRINGS}
+        info['offset'] = a['player_offset'][i].tolist()
+        lo, hi = int(a['rank_indptr'][i]), int(a['rank_indptr'][i + 1])
+        info['rankings'] = dict(zip(
+            [self.strings[s] for s in a['rank_series'][lo:hi].tolist()],
+            a['rank_value'][lo:hi].tolist()
+        ))
+        url = int(a['player_image_url'][i])
+        height, width = a['player_image_size'][i].tolist()
+        info['image'] = {
+            'url': self.strings[url], 'height': height, 'width': width
+        } if url >= 0 else None
+        latlon = a['player_latlon'][i].tolist()
+        if latlon[0] == latlon[0]:  # not NaN
+            info['latlon'] = latlon
+        return info
+
+    def players(self):
+        """{tag: player info}, as in data/players.json, built
+        lazily over the mapped columns
+        """
+        return _Players(self)
+
+    def citystates(self):
+        """{city, state: [lat, lon]}, as in data/citystates.json"""
+        return dict(zip(
+            [self.strings[c] for c in self.arrays['city_name'].tolist()],
+            self.arrays['city_latlon'].tolist()
+        ))
+
+    def graph(self):
+        """smashgraph.MatchGraph backed by the mapped arrays,
+        both the loss and the win view, with its tags and their
+        index read from the snapshot as they're used
+        """
+        a = self.arrays
+        tags = _Column(self.strings, a['graph_tag'])
+        return MatchGraph.from_csr(
+            tags, a['graph_indptr'], a['graph_indices'], a['graph_data'],
+            wins=(a['wins_indptr'], a['wins_indices'], a['wins_data']),
+            index=_Lookup(tags, a['graph_order'])
+        )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        sys.exit('usage: python snapshot.py build [snapshot path]')
+    build(*sys.argv[2:3])